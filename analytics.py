@@ -0,0 +1,132 @@
+import numpy as np
+
+from codec import SessionReader
+from metrics import REGISTRY
+from session import CHANNEL_IDS
+
+ANALYTICS_CHANNELS = ("motor_temp", "battery_temp", "vibration")
+GRID_POINTS = 200
+
+LAP_SECONDS = REGISTRY.histogram("vts_lap_analytics_seconds", "Time to profile one finished lap")
+
+# Each lap is cut out of the recorded series, pit stop time is removed, and the rest is
+# resampled onto a common grid of lap progress (0 = lap start, 1 = lap end), so any two laps
+# can be overlaid or subtracted point by point. Profiles are computed once per lap and
+# kept, so a finished lap only costs the decoding and interpolation of its own samples;
+# only a pit stop recorded after a lap it overlaps makes that lap be profiled again.
+
+
+def driving_clock(t, start_t, pit_starts, pit_ends):
+    # Seconds of driving since start_t; time spent inside a pit stop does not count
+    stopped = np.clip(t[:, None] - pit_starts, 0, pit_ends - pit_starts).sum(axis=1)
+    return t - start_t - stopped
+
+
+class LapProfile:
+    def __init__(self, lap, start_t, end_t, duration, energy_used):
+        self.lap = lap
+        self.start_t = start_t
+        self.end_t = end_t
+        self.duration = duration
+        self.energy_used = energy_used
+        self.driving_time = end_t - start_t
+        self.curves = {}
+        self.stats = {}
+
+
+class LapAnalytics:
+    def __init__(self, catalog, session_id, channels=ANALYTICS_CHANNELS, grid_points=GRID_POINTS):
+        self.catalog = catalog
+        self.session_id = session_id
+        self.channels = channels
+        self.grid = np.linspace(0.0, 1.0, grid_points)
+        self.reader = SessionReader(catalog.session(session_id)["path"])
+        self.laps = {}
+        self._pits = set()  # (start_t, end_t) of the pit stops already taken into account
+        self._matrices = {}
+
+    def update(self):
+        # Profiles the laps recorded since the last call, and again any earlier lap overlapped
+        # by a pit stop recorded since (a lap can finish while its pit stop is still open);
+        # returns their numbers
+        pits = self.catalog.pit_stops(self.session_id)
+        new_pits = [pit for pit in pits if (pit["start_t"], pit["end_t"]) not in self._pits]
+        self._pits.update((pit["start_t"], pit["end_t"]) for pit in new_pits)
+        rows = [row for row in self.catalog.laps(self.session_id)
+                if row["lap"] not in self.laps
+                or any(pit["end_t"] > row["start_t"] and pit["start_t"] < row["end_t"] for pit in new_pits)]
+        if not rows:
+            return []
+        self.reader.refresh()
+        pit_starts = np.array([pit["start_t"] for pit in pits])
+        pit_ends = np.array([pit["end_t"] for pit in pits])
+        for row in rows:
+            with LAP_SECONDS.time():
+                self.laps[row["lap"]] = self._profile(row, pit_starts, pit_ends)
+        self._matrices.clear()
+        return [row["lap"] for row in rows]
+
+    def _profile(self, row, pit_starts, pit_ends):
+        profile = LapProfile(row["lap"], row["start_t"], row["end_t"], row["duration"], row["energy_used"])
+        inside = (pit_ends > profile.start_t) & (pit_starts < profile.end_t)
+        pit_starts = np.clip(pit_starts[inside], profile.start_t, profile.end_t)
+        pit_ends = np.clip(pit_ends[inside], profile.start_t, profile.end_t)
+        profile.driving_time = float(driving_clock(np.array([profile.end_t]), profile.start_t,
+                                                   pit_starts, pit_ends)[0])
+        length = max(profile.driving_time, 1e-9)
+
+        for channel in self.channels:
+            t, values = self.reader.read(CHANNEL_IDS[channel], profile.start_t, profile.end_t)
+            driving = ~((t[:, None] >= pit_starts) & (t[:, None] <= pit_ends)).any(axis=1)
+            t, values = t[driving], values[driving]
+            if not len(t):
+                profile.curves[channel] = np.full(len(self.grid), np.nan)
+                continue
+            progress = driving_clock(t, profile.start_t, pit_starts, pit_ends) / length
+            profile.curves[channel] = np.interp(self.grid, progress, values)
+            peak = int(np.argmax(values))
+            profile.stats[channel] = {
+                "min": float(values.min()), "max": float(values.max()), "mean": float(values.mean()),
+                "start": float(values[0]), "end": float(values[-1]), "rise": float(values[-1] - values[0]),
+                "peak_at": float(progress[peak]),
+            }
+        return profile
+
+    def lap_numbers(self):
+        return sorted(self.laps)
+
+    def fastest_lap(self):
+        laps = [profile for profile in self.laps.values() if profile.duration > 0]
+        return min(laps, key=lambda profile: profile.duration).lap if laps else None
+
+    def matrix(self, channel):
+        # (laps, grid points) array of every lap's curve, in lap order; rebuilt only after update()
+        matrix = self._matrices.get(channel)
+        if matrix is None:
+            rows = [self.laps[lap].curves[channel] for lap in self.lap_numbers()]
+            matrix = np.vstack(rows) if rows else np.empty((0, len(self.grid)))
+            self._matrices[channel] = matrix
+        return matrix
+
+    def deltas(self, channel, reference):
+        # Every lap's curve minus the reference lap's, point by point along the lap
+        return self.matrix(channel) - self.laps[reference].curves[channel]
+
+    def summary(self, reference=None):
+        # Per-lap aggregates with their difference from the reference lap
+        reference = self.laps.get(reference if reference is not None else self.fastest_lap())
+        rows = []
+        for lap in self.lap_numbers():
+            profile = self.laps[lap]
+            row = {"lap": lap, "duration": profile.duration, "driving_time": profile.driving_time,
+                   "energy_used": profile.energy_used}
+            if reference is not None:
+                row["delta_duration"] = profile.duration - reference.duration
+                row["delta_energy"] = profile.energy_used - reference.energy_used
+            for channel, stats in profile.stats.items():
+                for name, value in stats.items():
+                    row[f"{channel}_{name}"] = value
+                    if reference is not None and channel in reference.stats:
+                        row[f"{channel}_{name}_delta"] = value - reference.stats[channel][name]
+            rows.append(row)
+        return rows
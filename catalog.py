@@ -0,0 +1,155 @@
+import sqlite3
+import threading
+
+from metrics import REGISTRY
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS sessions (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    started_at REAL NOT NULL,
+    ended_at REAL,
+    path TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS laps (
+    session_id INTEGER NOT NULL REFERENCES sessions(id),
+    lap INTEGER NOT NULL,
+    start_t REAL NOT NULL,
+    end_t REAL NOT NULL,
+    duration INTEGER NOT NULL,
+    energy_used REAL NOT NULL,
+    PRIMARY KEY (session_id, lap)
+);
+CREATE TABLE IF NOT EXISTS pit_stops (
+    session_id INTEGER NOT NULL REFERENCES sessions(id),
+    start_t REAL NOT NULL,
+    end_t REAL NOT NULL,
+    duration INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS alerts (
+    session_id INTEGER NOT NULL REFERENCES sessions(id),
+    t REAL NOT NULL,
+    kind TEXT NOT NULL,
+    channel TEXT,
+    value REAL
+);
+CREATE TABLE IF NOT EXISTS lap_stats (
+    session_id INTEGER NOT NULL,
+    lap INTEGER NOT NULL,
+    channel TEXT NOT NULL,
+    min REAL NOT NULL,
+    max REAL NOT NULL,
+    mean REAL NOT NULL,
+    count INTEGER NOT NULL,
+    PRIMARY KEY (session_id, lap, channel)
+);
+CREATE INDEX IF NOT EXISTS lap_stats_by_channel ON lap_stats (channel, max, min, mean);
+CREATE INDEX IF NOT EXISTS alerts_by_session ON alerts (session_id, t);
+CREATE INDEX IF NOT EXISTS pit_stops_by_session ON pit_stops (session_id, start_t);
+"""
+
+WRITE_SECONDS = REGISTRY.histogram("vts_catalog_write_seconds", "Time to write one catalog entry")
+
+STATS = ("min", "max", "mean")
+OPERATORS = (">", ">=", "<", "<=", "=")
+
+
+class SessionCatalog:
+    def __init__(self, path):
+        self.path = path
+        # Samples and alerts are recorded from the serial thread, queries come from the GUI
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.row_factory = sqlite3.Row
+        self.lock = threading.Lock()
+        self.conn.executescript(SCHEMA)
+        self.conn.commit()
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
+
+    def _fetch(self, query, params=()):
+        with self.lock:
+            return self.conn.execute(query, params).fetchall()
+
+    def _fetch_one(self, query, params=()):
+        with self.lock:
+            return self.conn.execute(query, params).fetchone()
+
+    # Writes, called by SessionRecorder as the session is recorded
+
+    def begin_session(self, started_at, path):
+        with self.lock, self.conn:
+            cur = self.conn.execute(
+                "INSERT INTO sessions (started_at, path) VALUES (?, ?)", (started_at, path))
+        return cur.lastrowid
+
+    def end_session(self, session_id, ended_at):
+        with self.lock, self.conn:
+            self.conn.execute("UPDATE sessions SET ended_at = ? WHERE id = ?", (ended_at, session_id))
+
+    def add_lap(self, session_id, lap, start_t, end_t, duration, energy_used, stats):
+        with WRITE_SECONDS.time(), self.lock, self.conn:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO laps VALUES (?, ?, ?, ?, ?, ?)",
+                (session_id, lap, start_t, end_t, duration, energy_used))
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO lap_stats VALUES (?, ?, ?, ?, ?, ?, ?)",
+                [(session_id, lap, channel, lo, hi, mean, count)
+                 for channel, (lo, hi, mean, count) in stats.items()])
+
+    def add_pit_stop(self, session_id, start_t, end_t, duration):
+        with WRITE_SECONDS.time(), self.lock, self.conn:
+            self.conn.execute("INSERT INTO pit_stops VALUES (?, ?, ?, ?)",
+                              (session_id, start_t, end_t, duration))
+
+    def add_alert(self, session_id, t, kind, channel=None, value=None):
+        with WRITE_SECONDS.time(), self.lock, self.conn:
+            self.conn.execute("INSERT INTO alerts VALUES (?, ?, ?, ?, ?)",
+                              (session_id, t, kind, channel, value))
+
+    # Queries
+
+    def sessions(self):
+        return self._fetch("SELECT * FROM sessions ORDER BY started_at DESC")
+
+    def session(self, session_id):
+        return self._fetch_one("SELECT * FROM sessions WHERE id = ?", (session_id,))
+
+    def laps(self, session_id):
+        return self._fetch(
+            "SELECT * FROM laps WHERE session_id = ? ORDER BY lap", (session_id,))
+
+    def lap(self, session_id, lap):
+        return self._fetch_one(
+            "SELECT * FROM laps WHERE session_id = ? AND lap = ?", (session_id, lap))
+
+    def pit_stops(self, session_id):
+        return self._fetch(
+            "SELECT * FROM pit_stops WHERE session_id = ? ORDER BY start_t", (session_id,))
+
+    def alerts(self, session_id, kind=None):
+        if kind is None:
+            return self._fetch(
+                "SELECT * FROM alerts WHERE session_id = ? ORDER BY t", (session_id,))
+        return self._fetch(
+            "SELECT * FROM alerts WHERE session_id = ? AND kind = ? ORDER BY t",
+            (session_id, kind))
+
+    def lap_stats(self, session_id, lap):
+        return self._fetch(
+            "SELECT * FROM lap_stats WHERE session_id = ? AND lap = ?", (session_id, lap))
+
+    def find_laps(self, channel, stat, op, value, session_id=None):
+        # e.g. find_laps("motor_temp", "max", ">", 80) -> every lap that went over 80 °C
+        if stat not in STATS or op not in OPERATORS:
+            raise ValueError(f"Unsupported lap filter: {stat} {op}")
+        query = (
+            "SELECT laps.*, lap_stats.min, lap_stats.max, lap_stats.mean "
+            "FROM lap_stats JOIN laps USING (session_id, lap) "
+            f"WHERE lap_stats.channel = ? AND lap_stats.{stat} {op} ?")
+        params = [channel, value]
+        if session_id is not None:
+            query += " AND session_id = ?"
+            params.append(session_id)
+        query += " ORDER BY session_id, lap"
+        return self._fetch(query, params)
@@ -0,0 +1,277 @@
+import os
+import struct
+import zlib
+import numpy as np
+
+from metrics import REGISTRY
+
+# A session file is a sequence of independently decodable blocks, one channel per block:
+#   header | compressed timestamps | compressed values
+# Timestamps are quantized to microseconds and stored as zigzagged delta-of-delta, values
+# are float64 XORed with their predecessor. Both are byte-shuffled into 8 byte planes;
+# planes that are entirely zero (the high bytes of slowly changing channels) are dropped.
+# The rest are deflated one by one, but a plane zlib cannot shrink to half its size (the
+# noisy low bytes of a vibration signal) is stored raw: inflating it would cost decode time for
+# next to no saving. Two leading bitmasks flag which planes are present and which deflated.
+#
+# Blocks are only written once a channel has BLOCK_SIZE samples (and once more per channel
+# when the session closes), so a 1 Hz temperature compresses as well as the vibration.
+# Until then samples sit in an uncompressed journal next to the session file, appended at
+# least every FLUSH_SECONDS and rewritten with just the pending samples once the ones
+# already in blocks dominate it. Readers merge the journal in, so a lap or a crashed
+# session sees everything up to the last journal write.
+
+MAGIC = b"VTS2"
+HEADER = struct.Struct("<4sBIddII")
+PLANE_LENGTH = struct.Struct("<I")
+BLOCK_SIZE = 4096
+FLUSH_SECONDS = 5.0
+JOURNAL_SUFFIX = ".tail"
+JOURNAL_MIN_RECORDS = 1 << 16  # the journal is not compacted below this many records
+TIME_SCALE = 1_000_000
+COMPRESSION_LEVEL = 6
+MIN_SAVING = 0.5
+
+BLOCK_SECONDS = REGISTRY.histogram("vts_store_block_seconds", "Time to encode and write one block")
+BLOCK_BYTES = REGISTRY.counter("vts_store_bytes_total", "Encoded bytes written to session files")
+DECODE_SECONDS = REGISTRY.histogram("vts_store_decode_seconds", "Time to read and decode a run of blocks")
+
+JOURNAL_DTYPE = np.dtype([("t", "<f8"), ("value", "<f8"), ("channel", "u1")])
+INDEX_DTYPE = np.dtype([("channel", "u1"), ("count", "u4"), ("t_first", "<f8"), ("t_last", "<f8"),
+                        ("offset", "<u8"), ("ts_len", "u4"), ("val_len", "u4")])
+
+
+def _shuffle(words):
+    # Raw planes first, then each deflated plane behind its compressed length
+    planes = words.view(np.uint8).reshape(-1, 8).T
+    present = deflated = 0
+    raw_planes, packed_planes = [], []
+    for i, plane in enumerate(planes):
+        if not plane.any():
+            continue
+        present |= 1 << i
+        raw = plane.tobytes()
+        packed = zlib.compress(raw, COMPRESSION_LEVEL)
+        if len(packed) < MIN_SAVING * len(raw):
+            deflated |= 1 << i
+            packed_planes += [PLANE_LENGTH.pack(len(packed)), packed]
+        else:
+            raw_planes.append(raw)
+    return bytes((present, deflated)) + b"".join(raw_planes + packed_planes)
+
+
+def _unshuffle(data, count, words):
+    # Fills words, a zeroed uint64 array of length count, from one shuffled stream
+    planes = words.view(np.uint8).reshape(count, 8)
+    present, deflated = data[0], data[1]
+    raw = [i for i in range(8) if (present & ~deflated) >> i & 1]
+    offset = 2 + len(raw) * count
+    if raw:
+        planes[:, raw] = np.frombuffer(data, dtype=np.uint8, count=len(raw) * count, offset=2).reshape(-1, count).T
+    for i in range(8):
+        if deflated >> i & 1:
+            (length,) = PLANE_LENGTH.unpack_from(data, offset)
+            offset += PLANE_LENGTH.size
+            planes[:, i] = np.frombuffer(zlib.decompress(data[offset:offset + length]), dtype=np.uint8)
+            offset += length
+
+
+def _segmented_cumsum(x, starts, counts):
+    # cumsum restarting at every block start; int64 wrap-around cancels out in the subtraction
+    total = np.cumsum(x)
+    total -= np.repeat(np.concatenate((np.zeros(1, total.dtype), total[starts[1:] - 1])), counts)
+    return total
+
+
+def encode_timestamps(t):
+    ticks = np.round(np.asarray(t, dtype=np.float64) * TIME_SCALE).astype(np.int64)
+    delta = np.diff(ticks, prepend=np.int64(0))
+    delta_of_delta = np.diff(delta, prepend=np.int64(0))
+    # Zigzag, so the small negative jitter of a sampled clock keeps its high bytes zero
+    return _shuffle(((delta_of_delta << 1) ^ (delta_of_delta >> 63)).view("<u8"))
+
+
+def encode_values(values):
+    bits = np.asarray(values, dtype="<f8").view("<u8")
+    xored = bits ^ np.concatenate(([np.uint64(0)], bits[:-1]))
+    return _shuffle(xored)
+
+
+def decode_blocks(blocks):
+    # blocks: [(timestamp stream, value stream, count)]. The streams are unpacked
+    # into one array each, and the integrations run once over all of them.
+    counts = np.array([block[2] for block in blocks], dtype=np.int64)
+    starts = np.cumsum(counts) - counts
+    ts_words = np.zeros(int(counts.sum()), dtype="<u8")
+    val_words = np.zeros(int(counts.sum()), dtype="<u8")
+    for (ts, vals, count), start in zip(blocks, starts):
+        _unshuffle(ts, count, ts_words[start:start + count])
+        _unshuffle(vals, count, val_words[start:start + count])
+
+    delta_of_delta = (ts_words >> np.uint64(1)).view(np.int64) ^ -(ts_words & np.uint64(1)).view(np.int64)
+    ticks = _segmented_cumsum(_segmented_cumsum(delta_of_delta, starts, counts), starts, counts)
+
+    bits = np.bitwise_xor.accumulate(val_words)
+    bits ^= np.repeat(np.concatenate((np.zeros(1, bits.dtype), bits[starts[1:] - 1])), counts)
+    return ticks / TIME_SCALE, bits.view("<f8")
+
+
+def encode_block(channel, t, values):
+    ts = encode_timestamps(t)
+    vals = encode_values(values)
+    header = HEADER.pack(MAGIC, channel, len(t), float(t[0]), float(t[-1]), len(ts), len(vals))
+    return header + ts + vals
+
+
+class SessionWriter:
+    def __init__(self, path, block_size=BLOCK_SIZE, flush_seconds=FLUSH_SECONDS):
+        self.path = path
+        self.block_size = block_size
+        # Pending samples reach the journal at least this often (in sample time)
+        self.flush_seconds = flush_seconds
+        self._file = open(path, "ab")
+        self._journal = open(path + JOURNAL_SUFFIX, "wb")
+        self._journal_records = 0
+        self._pending = {}
+        self._unjournaled = []
+        self._flushed_t = None
+
+    def append(self, channel, t, value):
+        times, values = self._pending.setdefault(channel, ([], []))
+        times.append(t)
+        values.append(value)
+        self._unjournaled.append((t, value, channel))
+        if len(times) >= self.block_size:
+            self._write_block(channel)
+        if self._flushed_t is None:
+            self._flushed_t = t
+        elif t - self._flushed_t >= self.flush_seconds:
+            self.flush()
+
+    def _write_block(self, channel):
+        times, values = self._pending.pop(channel)
+        if times:
+            with BLOCK_SECONDS.time():
+                block = encode_block(channel, times, values)
+                self._file.write(block)
+            BLOCK_BYTES.inc(len(block))
+
+    def _pending_records(self):
+        return [record for channel, (times, values) in self._pending.items()
+                for record in zip(times, values, [channel] * len(times))]
+
+    def flush(self):
+        # Blocks go to disk before the journal can forget their samples
+        self._file.flush()
+        pending = sum(len(times) for times, values in self._pending.values())
+        if self._journal_records > max(JOURNAL_MIN_RECORDS, 2 * pending):
+            # Mostly samples that are in blocks by now; start over with the pending ones
+            records = np.array(self._pending_records(), dtype=JOURNAL_DTYPE)
+            self._journal.close()
+            with open(self.path + JOURNAL_SUFFIX + ".new", "wb") as f:
+                f.write(records.tobytes())
+            os.replace(self.path + JOURNAL_SUFFIX + ".new", self.path + JOURNAL_SUFFIX)
+            self._journal = open(self.path + JOURNAL_SUFFIX, "ab")
+            self._journal_records = len(records)
+        elif self._unjournaled:
+            self._journal.write(np.array(self._unjournaled, dtype=JOURNAL_DTYPE).tobytes())
+            self._journal_records += len(self._unjournaled)
+        self._journal.flush()
+        self._unjournaled = []
+        self._flushed_t = None
+
+    def close(self):
+        # Each channel's last partial block; the journal is not needed once they are written
+        for channel in list(self._pending):
+            self._write_block(channel)
+        self._file.close()
+        self._journal.close()
+        os.remove(self.path + JOURNAL_SUFFIX)
+
+
+class SessionReader:
+    def __init__(self, path):
+        self.path = path
+        self.index = np.empty(0, dtype=INDEX_DTYPE)
+        self.journal = np.empty(0, dtype=JOURNAL_DTYPE)
+        self._end = 0
+        self.refresh()
+
+    def _scan(self, offset):
+        # Only headers are read; payloads are skipped so opening a long session stays cheap
+        rows = []
+        if not os.path.exists(self.path):
+            return rows, offset
+        size = os.path.getsize(self.path)
+        with open(self.path, "rb") as f:
+            while offset + HEADER.size <= size:
+                f.seek(offset)
+                magic, channel, count, t_first, t_last, ts_len, val_len = HEADER.unpack(f.read(HEADER.size))
+                end = offset + HEADER.size + ts_len + val_len
+                if magic != MAGIC or end > size:
+                    break  # torn write at the end of a session that did not close cleanly
+                rows.append((channel, count, t_first, t_last, offset, ts_len, val_len))
+                offset = end
+        return rows, offset
+
+    def refresh(self):
+        # The journal is read first: whatever the writer moves into blocks meanwhile is then
+        # found by the scan, and dropped from the journal below
+        journal = self._read_journal()
+        # Sessions only ever grow, so a live file is indexed from where the last scan stopped
+        rows, self._end = self._scan(self._end)
+        if rows:
+            self.index = np.concatenate((self.index, np.array(rows, dtype=INDEX_DTYPE)))
+        ends = np.full(256, -np.inf)
+        np.maximum.at(ends, self.index["channel"], self.index["t_last"])
+        self.journal = journal[journal["t"] > ends[journal["channel"]]]
+
+    def _read_journal(self):
+        try:
+            with open(self.path + JOURNAL_SUFFIX, "rb") as f:
+                data = f.read()
+        except FileNotFoundError:
+            return np.empty(0, dtype=JOURNAL_DTYPE)
+        # A write may be under way; only whole records count
+        return np.frombuffer(data, dtype=JOURNAL_DTYPE, count=len(data) // JOURNAL_DTYPE.itemsize)
+
+    def tail(self, channel, t0=None, t1=None):
+        # Journal samples of one channel that are not in a block yet, trimmed to [t0, t1]
+        rows = self.journal[self.journal["channel"] == channel]
+        if t0 is not None:
+            rows = rows[rows["t"] >= t0]
+        if t1 is not None:
+            rows = rows[rows["t"] <= t1]
+        return rows["t"].copy(), rows["value"].copy()
+
+    def blocks(self, channel, t0=None, t1=None):
+        mask = self.index["channel"] == channel
+        if t0 is not None:
+            mask &= self.index["t_last"] >= t0
+        if t1 is not None:
+            mask &= self.index["t_first"] <= t1
+        return np.flatnonzero(mask)
+
+    def decode_block(self, block, f=None):
+        return self.decode_run([block], f)
+
+    def decode_run(self, blocks, f=None):
+        if f is None:
+            with open(self.path, "rb") as f:
+                return self.decode_run(blocks, f)
+        with DECODE_SECONDS.time():
+            streams = []
+            for row in self.index[blocks]:
+                f.seek(int(row["offset"]) + HEADER.size)
+                streams.append((f.read(int(row["ts_len"])), f.read(int(row["val_len"])),
+                                int(row["count"])))
+            if not streams:
+                return np.empty(0), np.empty(0)
+            return decode_blocks(streams)
+
+    def read(self, channel, t0=None, t1=None):
+        t, values = self.decode_run(self.blocks(channel, t0, t1))
+        start = 0 if t0 is None else np.searchsorted(t, t0, side="left")
+        stop = len(t) if t1 is None else np.searchsorted(t, t1, side="right")
+        tail_t, tail_values = self.tail(channel, t0, t1)
+        return np.concatenate((t[start:stop], tail_t)), np.concatenate((values[start:stop], tail_values))
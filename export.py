@@ -0,0 +1,188 @@
+import argparse
+import logging
+import os
+import numpy as np
+
+from codec import SessionReader
+from session import SESSION_DIR, CHANNELS, CHANNEL_IDS, open_catalog
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # Parquet export is optional
+    pa = None
+
+FORMATS = ("csv", "parquet")
+TABLES = ("laps", "pit_stops", "alerts")
+TABLE_COLUMNS = {
+    "laps": ("lap", "start_t", "end_t", "duration", "energy_used"),
+    "pit_stops": ("start_t", "end_t", "duration"),
+    "alerts": ("t", "kind", "channel", "value"),
+}
+# Parquet column types by name; every other column is float64
+COLUMN_TYPES = {"lap": "int64", "duration": "int64", "kind": "string", "channel": "string"}
+ROW_GROUP_ROWS = 1 << 20  # Parquet chunks are buffered into row groups about this size
+
+log = logging.getLogger(__name__)
+
+# Series are streamed one codec block at a time, so memory use does not depend on session
+# length. Every chunk is formatted as whole columns by NumPy; no Python code runs per row.
+
+
+def format_csv(columns):
+    lines = None
+    for column in columns:
+        field = np.asarray(column)
+        if field.dtype == object:
+            # Missing catalog values are empty fields
+            field = np.where(np.equal(field, None), "", field)
+        field = field.astype(str)
+        lines = field if lines is None else np.strings.add(np.strings.add(lines, ","), field)
+    return "\n".join(lines.tolist()) + "\n" if lines is not None and len(lines) else ""
+
+
+class CsvWriter:
+    def __init__(self, path, names):
+        self.file = open(path, "w", newline="")
+        self.file.write(",".join(names) + "\n")
+        self.rows = 0
+
+    def write(self, columns):
+        self.file.write(format_csv(columns))
+        self.rows += len(columns[0])
+
+    def close(self):
+        self.file.close()
+
+
+class ParquetWriter:
+    def __init__(self, path, names):
+        if pa is None:
+            raise RuntimeError("Parquet export needs pyarrow (pip install pyarrow)")
+        # The schema is fixed per table, so an empty export has the same column types
+        self.schema = pa.schema([(name, pa.type_for_alias(COLUMN_TYPES.get(name, "float64")))
+                                 for name in names])
+        self.writer = pq.ParquetWriter(path, self.schema)
+        self.pending = []
+        self.buffered = 0
+        self.rows = 0
+
+    def write(self, columns):
+        # Codec blocks are small; one row group each would bloat the footer and slow readers
+        self.pending.append(columns)
+        self.buffered += len(columns[0])
+        self.rows += len(columns[0])
+        if self.buffered >= ROW_GROUP_ROWS:
+            self.flush()
+
+    def flush(self):
+        if not self.pending:
+            return
+        columns = [np.concatenate(column) for column in zip(*self.pending)]
+        self.writer.write_table(pa.table(columns, schema=self.schema), row_group_size=ROW_GROUP_ROWS)
+        self.pending = []
+        self.buffered = 0
+
+    def close(self):
+        self.flush()
+        self.writer.close()
+
+
+WRITERS = {"csv": CsvWriter, "parquet": ParquetWriter}
+
+
+def series_chunks(path, channel, t0=None, t1=None):
+    # Yields (t, values) for one channel, trimmed to [t0, t1], one block at a time
+    reader = SessionReader(path)
+    with open(path, "rb") as f:
+        for block in reader.blocks(CHANNEL_IDS[channel], t0, t1):
+            t, values = reader.decode_block(block, f)
+            lo = 0 if t0 is None else np.searchsorted(t, t0, side="left")
+            hi = len(t) if t1 is None else np.searchsorted(t, t1, side="right")
+            if hi > lo:
+                yield t[lo:hi], values[lo:hi]
+    t, values = reader.tail(CHANNEL_IDS[channel], t0, t1)
+    if len(t):
+        yield t, values
+
+
+def table_rows(catalog, session_id, table, t0=None, t1=None):
+    if table == "laps":
+        rows = catalog.laps(session_id)
+    elif table == "pit_stops":
+        rows = catalog.pit_stops(session_id)
+    else:
+        rows = catalog.alerts(session_id)
+    # Laps and pit stops are kept if they overlap the range, alerts if they fall inside it
+    start, end = ("t", "t") if table == "alerts" else ("end_t", "start_t")
+    return [row for row in rows
+            if (t0 is None or row[start] >= t0) and (t1 is None or row[end] <= t1)]
+
+
+def export_session(catalog, session_id, directory, fmt="csv", channels=CHANNELS, tables=TABLES,
+                   t0=None, t1=None):
+    if fmt not in FORMATS:
+        raise ValueError(f"Unknown export format: {fmt}")
+    unknown = set(channels) - set(CHANNELS) | set(tables) - set(TABLES)
+    if unknown:
+        raise ValueError(f"Unknown channels or tables: {', '.join(sorted(unknown))}")
+    session = catalog.session(session_id)
+    if session is None:
+        raise KeyError(f"Unknown session {session_id}")
+    os.makedirs(directory, exist_ok=True)
+    written = {}
+
+    for table in tables:
+        names = TABLE_COLUMNS[table]
+        rows = table_rows(catalog, session_id, table, t0, t1)
+        path = os.path.join(directory, f"{table}.{fmt}")
+        writer = WRITERS[fmt](path, names)
+        if rows:
+            # Object columns keep missing values (alerts without a channel or value) as None,
+            # an empty CSV field or a Parquet null
+            writer.write([np.array([row[name] for row in rows], dtype=object) for name in names])
+        writer.close()
+        written[path] = writer.rows
+
+    for channel in channels:
+        path = os.path.join(directory, f"{channel}.{fmt}")
+        writer = WRITERS[fmt](path, ("t", "value"))
+        try:
+            for t, values in series_chunks(session["path"], channel, t0, t1):
+                writer.write((t, values))
+        finally:
+            writer.close()
+        written[path] = writer.rows
+
+    log.info("Exported session %s to %s (%d files)", session_id, directory, len(written))
+    return written
+
+
+def parse_list(text):
+    return tuple(field.strip() for field in text.split(",") if field.strip())
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+    parser = argparse.ArgumentParser(description="Export a recorded VTS session")
+    parser.add_argument("session_id", type=int, help="session number as shown under Recorded Sessions")
+    parser.add_argument("output", help="directory to write the exported files to")
+    parser.add_argument("--format", choices=FORMATS, default="csv")
+    parser.add_argument("--channels", type=parse_list, default=CHANNELS,
+                        help=f"comma separated channels to export (default: all of {', '.join(CHANNELS)})")
+    parser.add_argument("--tables", type=parse_list, default=TABLES,
+                        help=f"comma separated tables to export (default: {', '.join(TABLES)})")
+    parser.add_argument("--start", type=float, default=None, help="start of the time range in seconds")
+    parser.add_argument("--end", type=float, default=None, help="end of the time range in seconds")
+    parser.add_argument("--sessions", default=SESSION_DIR, help="directory holding the recorded sessions")
+    args = parser.parse_args()
+    catalog = open_catalog(args.sessions)
+    try:
+        written = export_session(catalog, args.session_id, args.output, args.format, args.channels,
+                                 args.tables, args.start, args.end)
+    except (ValueError, KeyError, RuntimeError) as e:
+        parser.error(str(e))
+    finally:
+        catalog.close()
+    for path, rows in written.items():
+        print(f"{path}: {rows} rows")
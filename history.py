@@ -0,0 +1,243 @@
+import collections
+import os
+import queue
+import threading
+import numpy as np
+
+from codec import SessionReader
+from metrics import REGISTRY
+from ringbuffer import MirroredRing
+from session import CHANNEL_IDS
+
+# Plots read history in two tiers: the newest samples from a ring buffer in RAM, everything
+# older from the recorded session file, one codec block at a time (plus the journal of
+# samples not in a block yet, for sessions that are not live). Decoded blocks sit in an
+# LRU cache, and views too wide for the cache are drawn from per-block min/max envelopes,
+# so memory stays bounded however long the session runs.
+
+RECENT_SAMPLES = 16384
+CACHE_BLOCKS = 64
+ENVELOPE_BLOCKS = 4096
+ENVELOPE_POINTS = 128
+MAX_PLOT_POINTS = 4000
+
+CACHE_LOOKUPS = {result: REGISTRY.counter("vts_history_cache_total", "History block cache lookups",
+                                          {"result": result})
+                 for result in ("hit", "miss")}
+LOAD_SECONDS = REGISTRY.histogram("vts_history_load_seconds", "Time to assemble one plot window from history")
+
+
+def decimate(t, values, max_points=MAX_PLOT_POINTS):
+    # Min/max per bucket keeps spikes visible when there are more samples than pixels
+    if len(t) <= max_points:
+        return t, values
+    width = -(-2 * len(t) // max_points)
+    whole = len(t) // width * width
+    buckets = values[:whole].reshape(-1, width)
+    base = np.arange(0, whole, width)[:, None]
+    picks = np.sort(np.hstack((base + buckets.argmin(axis=1)[:, None], base + buckets.argmax(axis=1)[:, None])), axis=1)
+    index = np.concatenate((picks.ravel(), np.arange(whole, len(t))))
+    return t[index], values[index]
+
+
+class RecentBuffer(MirroredRing):
+    def __init__(self, capacity=RECENT_SAMPLES):
+        super().__init__(capacity, columns=2)
+
+    def window(self, t0=None, t1=None):
+        t, values = self.latest()
+        lo = 0 if t0 is None else np.searchsorted(t, t0, side="left")
+        hi = len(t) if t1 is None else np.searchsorted(t, t1, side="right")
+        return t[lo:hi].copy(), values[lo:hi].copy()
+
+    def span(self):
+        if not self.filled:
+            return None
+        t = self.latest()[0]
+        return t[0], t[-1]
+
+
+class RecentHistory:
+    # Filled by the serial thread and read by the plots, so every access takes the lock
+    def __init__(self, channels, capacity=RECENT_SAMPLES):
+        self.buffers = {CHANNEL_IDS[channel]: RecentBuffer(capacity) for channel in channels}
+        self._lock = threading.Lock()
+
+    def extend(self, t, channels, values):
+        # t, channels, values: parallel arrays of ingested records, in time order
+        channels = np.asarray(channels)
+        with self._lock:
+            for channel, buffer in self.buffers.items():
+                mask = channels == channel
+                if mask.any():
+                    buffer.extend(np.asarray(t)[mask], np.asarray(values)[mask])
+
+    def add(self, t, channel, value):
+        # One (t, channel id, value) record, as the serial thread ingests it; most records
+        # are vibration or derived channels the graphs do not keep, and cost one lookup
+        buffer = self.buffers.get(channel)
+        if buffer is not None:
+            with self._lock:
+                buffer.append(t, value)
+
+    def append(self, channel, t, value):
+        self.add(t, CHANNEL_IDS[channel], value)
+
+    def window(self, channel, t0=None, t1=None):
+        with self._lock:
+            return self.buffers[CHANNEL_IDS[channel]].window(t0, t1)
+
+    def span(self, channel):
+        with self._lock:
+            return self.buffers[CHANNEL_IDS[channel]].span()
+
+
+class LRUCache:
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self._items = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            value = self._items.get(key)
+            if value is not None:
+                self._items.move_to_end(key)
+        CACHE_LOOKUPS["miss" if value is None else "hit"].inc()
+        return value
+
+    def put(self, key, value):
+        with self._lock:
+            self._items[key] = value
+            self._items.move_to_end(key)
+            while len(self._items) > self.capacity:
+                self._items.popitem(last=False)
+
+
+class SeriesHistory:
+    # Already loaded arrays behind the same interface (the empty plot before recording starts)
+    def __init__(self, series):
+        self.series = series
+
+    def window(self, channel, t0=None, t1=None, max_points=MAX_PLOT_POINTS):
+        t, values = self.series[channel]
+        lo = 0 if t0 is None else np.searchsorted(t, t0, side="left")
+        hi = len(t) if t1 is None else np.searchsorted(t, t1, side="right")
+        return decimate(t[lo:hi], values[lo:hi], max_points)
+
+    def span(self, channels):
+        spans = [(t[0], t[-1]) for t, values in (self.series[c] for c in channels) if len(t)]
+        if not spans:
+            return None
+        return min(lo for lo, hi in spans), max(hi for lo, hi in spans)
+
+    def prefetch(self, channels, t0, t1, direction):
+        pass
+
+    def close(self):
+        pass
+
+
+class SessionHistory:
+    def __init__(self, path, recent=None, cache_blocks=CACHE_BLOCKS):
+        self.reader = SessionReader(path)
+        self.size = os.path.getsize(path) if os.path.exists(path) else 0
+        # Live sessions keep growing; the RAM tier covers what is not on disk yet
+        self.recent = recent
+        self.blocks = LRUCache(cache_blocks)
+        self.envelopes = LRUCache(ENVELOPE_BLOCKS)
+        self._requests = queue.Queue()
+        self._worker = threading.Thread(target=self._prefetch_loop, daemon=True)
+        self._worker.start()
+
+    def refresh(self):
+        size = os.path.getsize(self.reader.path) if os.path.exists(self.reader.path) else 0
+        if size != self.size:
+            self.size = size
+            self.reader.refresh()
+
+    def _block(self, block):
+        decoded = self.blocks.get(block)
+        if decoded is None:
+            decoded = self.reader.decode_block(block)
+            self.blocks.put(block, decoded)
+        return decoded
+
+    def _envelope(self, block):
+        envelope = self.envelopes.get(block)
+        if envelope is None:
+            # Decoded straight into an envelope without evicting the raw blocks being viewed
+            decoded = self.blocks.get(block)
+            if decoded is None:
+                decoded = self.reader.decode_block(block)
+            envelope = decimate(*decoded, ENVELOPE_POINTS)
+            self.envelopes.put(block, envelope)
+        return envelope
+
+    def _load(self, blocks):
+        # Too many blocks for the raw cache means the view is far wider than the screen
+        load = self._envelope if len(blocks) > self.blocks.capacity // 2 else self._block
+        return [load(block) for block in blocks]
+
+    def window(self, channel, t0=None, t1=None, max_points=MAX_PLOT_POINTS):
+        with LOAD_SECONDS.time():
+            if self.recent is not None:
+                self.refresh()
+            channel_id = CHANNEL_IDS[channel]
+            blocks = self.reader.blocks(channel_id, t0, t1)
+            pieces = self._load(blocks)
+            if self.recent is not None:
+                on_disk = self.reader.blocks(channel_id)
+                disk_end = self.reader.index["t_last"][on_disk[-1]] if len(on_disk) else -np.inf
+                start = disk_end if t0 is None else max(t0, disk_end)
+                recent = self.recent.window(channel, start, t1)
+                # Blocks are flushed while the GUI still holds their samples; skip the overlap
+                pieces.append((recent[0][recent[0] > disk_end], recent[1][recent[0] > disk_end]))
+            else:
+                pieces.append(self.reader.tail(channel_id, t0, t1))
+            if not pieces:
+                return np.empty(0), np.empty(0)
+            t = np.concatenate([piece[0] for piece in pieces])
+            values = np.concatenate([piece[1] for piece in pieces])
+            lo = 0 if t0 is None else np.searchsorted(t, t0, side="left")
+            hi = len(t) if t1 is None else np.searchsorted(t, t1, side="right")
+            return decimate(t[lo:hi], values[lo:hi], max_points)
+
+    def span(self, channels):
+        if self.recent is not None:
+            self.refresh()
+        ids = [CHANNEL_IDS[channel] for channel in channels]
+        rows = self.reader.index[np.isin(self.reader.index["channel"], ids)]
+        spans = [(rows["t_first"].min(), rows["t_last"].max())] if len(rows) else []
+        if self.recent is not None:
+            spans += [span for span in (self.recent.span(channel) for channel in channels) if span]
+        else:
+            tail = self.reader.journal[np.isin(self.reader.journal["channel"], ids)]
+            spans += [(tail["t"].min(), tail["t"].max())] if len(tail) else []
+        if not spans:
+            return None
+        return min(lo for lo, hi in spans), max(hi for lo, hi in spans)
+
+    def prefetch(self, channels, t0, t1, direction):
+        # Warm the cache for the next screenful in the direction the view is moving
+        if direction == 0:
+            return
+        width = t1 - t0
+        ahead = (t1, t1 + width) if direction > 0 else (t0 - width, t0)
+        self._requests.put((channels, ahead))
+
+    def _prefetch_loop(self):
+        while True:
+            request = self._requests.get()
+            # Only the newest request matters once the user has scrolled past the older ones
+            while not self._requests.empty():
+                request = self._requests.get_nowait()
+            if request is None:
+                return
+            channels, (t0, t1) = request
+            for channel in channels:
+                self._load(self.reader.blocks(CHANNEL_IDS[channel], t0, t1))
+
+    def close(self):
+        self._requests.put(None)
+
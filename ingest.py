@@ -0,0 +1,411 @@
+import collections
+import logging
+import multiprocessing
+import queue
+import threading
+import time
+from multiprocessing import shared_memory
+import numpy as np
+import serial
+
+from metrics import REGISTRY
+from session import SESSION_DIR, CHANNEL_IDS, open_catalog, SessionRecorder
+from spectrum import HISTORY, SpectrumAnalyzer
+
+PREFIXES = (("MT:", "motor_temp"), ("BT:", "battery_temp"), ("V:", "vibration"))
+ALERT_CHANNEL = 255
+RING_CAPACITY = 65536
+RECORD_DTYPE = np.dtype([("t", "<f8"), ("value", "<f8"), ("channel", "<u8")])
+HEADER_WORDS = 2  # write sequence number, capacity
+REPLY_TIMEOUT = 5
+POLICIES = ("block", "drop-oldest", "latest")
+QUEUE_SIZE = 4096
+METRICS_INTERVAL = 1.0
+
+log = logging.getLogger(__name__)
+
+LINES = REGISTRY.counter("vts_serial_lines_total", "Lines read from the serial port")
+SERIAL_ERRORS = REGISTRY.counter("vts_errors_total", "Errors by pipeline stage", {"stage": "serial"})
+PARSE_ERRORS = REGISTRY.counter("vts_errors_total", "Errors by pipeline stage", {"stage": "parse"})
+RECORD_ERRORS = REGISTRY.counter("vts_errors_total", "Errors by pipeline stage", {"stage": "record"})
+INGEST_SECONDS = REGISTRY.histogram("vts_ingest_seconds", "Time to parse, record and analyse one line")
+SPECTRUM_WINDOWS = REGISTRY.counter("vts_spectrum_windows_total", "FFT windows analysed")
+
+
+def parse_line(line):
+    for prefix, channel in PREFIXES:
+        if prefix in line:
+            return channel, float(line.split(prefix)[1].strip())
+    if "W" in line:
+        return "warning", None
+    return None
+
+
+class LineIngestor:
+    # Parses and records one line, returning the (t, channel id, value) records for displays
+    def __init__(self, recorder, spectrum=None):
+        self.recorder = recorder
+        self.spectrum = spectrum
+        self.warning_active = False
+
+    def ingest(self, line):
+        LINES.inc()
+        with INGEST_SECONDS.time():
+            try:
+                parsed = parse_line(line)
+            except ValueError as e:
+                PARSE_ERRORS.inc()
+                log.warning("Error processing serial data: %s", e)
+                return []
+            if parsed is None:
+                return []
+            channel, value = parsed
+            t = self.recorder.now()
+            if channel == "warning":
+                if not self.warning_active:
+                    self.warning_active = True
+                    self.alert("warning")
+                return [(t, ALERT_CHANNEL, 0.0)]
+            self.recorder.record_sample(channel, value, t)
+            records = [(t, CHANNEL_IDS[channel], value)]
+            if channel == "vibration" and self.spectrum is not None:
+                alerts = self.spectrum.push_sample(value)
+                if alerts is not None:
+                    SPECTRUM_WINDOWS.inc()
+                    for name, derived in self.spectrum.derived():
+                        self.recorder.record_sample(name, derived, t)
+                        records.append((t, CHANNEL_IDS[name], derived))
+                    for name, energy in alerts:
+                        self.alert("vibration_band", name, energy)
+                        records.append((t, ALERT_CHANNEL, energy))
+            return records
+
+    def alert(self, kind, channel=None, value=None):
+        REGISTRY.counter("vts_alerts_total", "Alerts raised", {"kind": kind}).inc()
+        self.recorder.record_alert(kind, channel, value)
+
+
+class SpectrumFeed:
+    # Stands in for the GUI's Spectrogram inside the ingest process: every window goes to
+    # the GUI over a queue, so the display shows the same analysis as the recorded band
+    # channels. A GUI that falls behind skips rows rather than holding up ingest.
+    def __init__(self, rows):
+        self.rows = rows
+
+    def add(self, power_db, band_energy, peak_hz):
+        try:
+            self.rows.put_nowait((power_db.copy(), band_energy.copy(), peak_hz))
+        except queue.Full:
+            pass
+
+
+class IngestQueue:
+    # Bounded hand-off from the serial thread to the GUI. Everything is recorded before it
+    # gets here, so the policy only decides what the displays see when they fall behind:
+    #   block        the serial thread waits for the GUI to catch up; meanwhile nothing is
+    #                read, and a long stall can overflow the serial port and lose input
+    #   drop-oldest  the oldest undelivered records are discarded
+    #   latest       only the newest record per channel is kept
+    # depth is what the queue holds, so under latest it never exceeds the number of
+    # channels; high_water counts every record that arrived between two drains instead.
+    def __init__(self, maxsize=QUEUE_SIZE, policy="latest"):
+        if policy not in POLICIES:
+            raise ValueError(f"Unknown ingest policy: {policy}")
+        self.maxsize = maxsize
+        self.policy = policy
+        self._items = collections.deque()
+        self._latest = {}
+        self._cond = threading.Condition()
+        self.closed = False
+        self.high_water = 0
+        self.dropped = 0
+        self.lag = 0.0
+        self._arrived = 0
+
+    def depth(self):
+        return len(self._latest) if self.policy == "latest" else len(self._items)
+
+    def put(self, record):
+        with self._cond:
+            if self.policy == "latest":
+                if record[1] in self._latest:
+                    self.dropped += 1
+                self._latest[record[1]] = record
+            else:
+                if len(self._items) >= self.maxsize:
+                    if self.policy == "block":
+                        while len(self._items) >= self.maxsize and not self.closed:
+                            self._cond.wait(0.1)
+                        if self.closed:
+                            return
+                    else:
+                        self._items.popleft()
+                        self.dropped += 1
+                self._items.append(record)
+            self._arrived += 1
+            backlog = self._arrived if self.policy == "latest" else self.depth()
+            self.high_water = max(self.high_water, backlog)
+
+    def get_batch(self, now=None):
+        # now: the recorder clock, to measure how far behind live the drained records are
+        with self._cond:
+            self._arrived = 0
+            if self.policy == "latest":
+                batch = sorted(self._latest.values())
+                self._latest.clear()
+            else:
+                batch = list(self._items)
+                self._items.clear()
+                self._cond.notify_all()
+        # Age of the oldest record still waiting when the displays caught up
+        self.lag = now - min(record[0] for record in batch) if batch and now is not None else 0.0
+        return batch
+
+    def close(self):
+        with self._cond:
+            self.closed = True
+            self._cond.notify_all()
+
+    def stats(self):
+        return {"depth": self.depth(), "high_water": self.high_water,
+                "dropped": self.dropped, "lag": self.lag}
+
+
+class SharedRing:
+    # Single-writer ring of samples in shared memory. header[0] counts every record ever
+    # written, so readers can tell how far behind they are without taking a lock.
+    def __init__(self, capacity=RING_CAPACITY, name=None):
+        size = HEADER_WORDS * 8 + capacity * RECORD_DTYPE.itemsize
+        self.owner = name is None
+        self.shm = shared_memory.SharedMemory(name=name, create=self.owner, size=size if self.owner else 0)
+        self.capacity = capacity
+        self.header = np.ndarray((HEADER_WORDS,), dtype="<u8", buffer=self.shm.buf)
+        self.records = np.ndarray((capacity,), dtype=RECORD_DTYPE, buffer=self.shm.buf, offset=HEADER_WORDS * 8)
+        if self.owner:
+            self.header[:] = (0, capacity)
+        self._seq = int(self.header[0])
+
+    @property
+    def name(self):
+        return self.shm.name
+
+    def push(self, t, channel, value):
+        self.records[self._seq % self.capacity] = (t, value, channel)
+        self._seq += 1
+        # Publish only after the record is in place so readers never see a half-written slot
+        self.header[0] = self._seq
+
+    def read(self, since):
+        seq = int(self.header[0])
+        first = max(since, seq - self.capacity)
+        start = first % self.capacity
+        count = seq - first
+        if start + count <= self.capacity:
+            batch = self.records[start:start + count].copy()
+        else:
+            batch = np.concatenate((self.records[start:], self.records[:start + count - self.capacity]))
+        # The writer may have lapped us while copying; discard any slots it reused. It writes
+        # slot header[0] % capacity before publishing, so that slot may be mid-write too.
+        overrun = min(int(self.header[0]) + 1 - self.capacity - first, count)
+        if overrun > 0:
+            batch = batch[overrun:]
+            first += overrun
+        return batch, seq, first - since
+
+    def close(self):
+        self.header = None
+        self.records = None
+        self.shm.close()
+        if self.owner:
+            self.shm.unlink()
+
+
+def run_ingest(ring_name, capacity, control, replies, metrics, spectrum, directory, spectrum_options):
+    REGISTRY.reset()
+    ring = SharedRing(capacity, name=ring_name)
+    recorder = SessionRecorder(open_catalog(directory), directory)
+    # Rows still queued when the child stops are only display data; do not wait on them at exit
+    spectrum.cancel_join_thread()
+    ingestor = LineIngestor(recorder, SpectrumAnalyzer(**spectrum_options, display=SpectrumFeed(spectrum)))
+    # The monotonic clock is shared between processes, so the GUI can timestamp on the same scale
+    replies.put(("session", recorder.session_id, time.monotonic() - recorder.now()))
+    ser = None
+    running = True
+    next_metrics = time.monotonic()
+
+    while running:
+        if time.monotonic() >= next_metrics:
+            next_metrics += METRICS_INTERVAL
+            try:
+                metrics.put_nowait(REGISTRY.collect((("process", "ingest"),), touched_only=True))
+            except queue.Full:
+                pass
+
+        while True:
+            try:
+                command, *args = control.get_nowait()
+            except queue.Empty:
+                break
+            if command == "connect":
+                try:
+                    ser = serial.Serial(args[0], args[1], timeout=0.1)
+                    replies.put(("connected", True))
+                except Exception as e:
+                    SERIAL_ERRORS.inc()
+                    log.error("Serial connection error: %s", e)
+                    replies.put(("connected", False))
+            elif command == "stop":
+                running = False
+            else:
+                # A failing session or catalog write is counted and logged; the child keeps
+                # recording, and the GUI still gets the reply it is waiting for
+                try:
+                    if command == "sample":
+                        recorder.record_sample(*args)
+                    elif command == "lap":
+                        recorder.record_lap(*args)
+                    elif command == "pit_begin":
+                        recorder.begin_pit_stop()
+                    elif command == "pit_end":
+                        recorder.end_pit_stop(*args)
+                    elif command == "alert":
+                        recorder.record_alert(*args)
+                    elif command == "flush":
+                        recorder.flush()
+                except Exception as e:
+                    RECORD_ERRORS.inc()
+                    log.error("Ingest command %s failed: %s", command, e)
+                if command == "flush":
+                    replies.put(("flushed",))
+
+        if ser is None or not running:
+            time.sleep(0.05)
+            continue
+
+        try:
+            line = ser.readline().decode('utf-8').strip()
+        except Exception as e:
+            SERIAL_ERRORS.inc()
+            log.error("Error reading serial: %s", e)
+            time.sleep(1)
+            continue
+        if not line:
+            continue
+        try:
+            for record in ingestor.ingest(line):
+                ring.push(*record)
+        except Exception as e:
+            RECORD_ERRORS.inc()
+            log.error("Error recording serial data: %s", e)
+
+    if ser is not None and ser.is_open:
+        ser.close()
+    recorder.close()
+    ring.close()
+
+
+class IngestProcess:
+    # GUI-side handle for run_ingest. It offers the same recording calls as
+    # SessionRecorder, forwarding them to the child, and exposes new samples via poll().
+    # poll() also moves the child's spectrum windows into spectrogram.
+    def __init__(self, capacity=RING_CAPACITY, directory=SESSION_DIR, spectrum_options=None, spectrogram=None):
+        self.ring = SharedRing(capacity)
+        self.control = multiprocessing.Queue()
+        self.replies = multiprocessing.Queue()
+        # Latest metrics snapshot from the child; it skips a publish rather than queue them up
+        self.metrics = multiprocessing.Queue(maxsize=1)
+        self.remote_metrics = {}
+        REGISTRY.add_remote(lambda: self.remote_metrics)
+        self.spectrum = multiprocessing.Queue(maxsize=HISTORY)
+        self.spectrogram = spectrogram
+        self.process = multiprocessing.Process(
+            target=run_ingest, args=(self.ring.name, capacity, self.control, self.replies, self.metrics,
+                                     self.spectrum, directory, spectrum_options or {}),
+            daemon=True)
+        self.process.start()
+        self.running = True
+        try:
+            self.session_id, self.clock = self._reply("session")
+        except RuntimeError:
+            self.ring.close()
+            raise
+        self.read_seq = 0
+        self.high_water = 0
+        self.dropped = 0
+        self.lag = 0.0
+
+    def _reply(self, expected):
+        # Waits in short steps, so a child that has died is noticed at once
+        deadline = time.monotonic() + REPLY_TIMEOUT
+        while True:
+            try:
+                kind, *args = self.replies.get(timeout=0.1)
+                break
+            except queue.Empty:
+                if not self.alive():
+                    raise RuntimeError(f"Ingest process exited with code {self.process.exitcode}")
+                if time.monotonic() >= deadline:
+                    raise RuntimeError(f"Ingest process did not reply ({expected})")
+        if kind != expected:
+            raise RuntimeError(f"Unexpected reply from ingest process: {kind}")
+        return args
+
+    def now(self):
+        return time.monotonic() - self.clock
+
+    def alive(self):
+        return self.process.is_alive()
+
+    def connect_serial(self, port, baud_rate):
+        self.control.put(("connect", port, baud_rate))
+        return self._reply("connected")[0]
+
+    def record_sample(self, channel, value):
+        self.control.put(("sample", channel, value))
+
+    def record_lap(self, lap, duration, energy_used):
+        self.control.put(("lap", lap, duration, energy_used))
+
+    def begin_pit_stop(self):
+        self.control.put(("pit_begin",))
+
+    def end_pit_stop(self, duration):
+        self.control.put(("pit_end", duration))
+
+    def record_alert(self, kind, channel=None, value=None):
+        self.control.put(("alert", kind, channel, value))
+
+    def flush(self):
+        self.control.put(("flush",))
+        self._reply("flushed")
+
+    def poll(self):
+        if self.running and not self.alive():
+            self.running = False
+            log.error("Ingest process exited with code %s; recording has stopped", self.process.exitcode)
+        batch, self.read_seq, dropped = self.ring.read(self.read_seq)
+        self.dropped += dropped
+        self.high_water = max(self.high_water, len(batch) + dropped)
+        # Age of the oldest record still waiting when the display caught up
+        self.lag = self.now() - batch["t"][0] if len(batch) else 0.0
+        try:
+            self.remote_metrics = self.metrics.get_nowait()
+        except queue.Empty:
+            pass
+        while True:
+            try:
+                row = self.spectrum.get_nowait()
+            except queue.Empty:
+                break
+            if self.spectrogram is not None:
+                self.spectrogram.add(*row)
+        return batch
+
+    def stats(self):
+        return {"depth": int(self.ring.header[0]) - self.read_seq, "high_water": self.high_water,
+                "dropped": self.dropped, "lag": self.lag}
+
+    def close(self):
+        self.control.put(("stop",))
+        self.process.join(REPLY_TIMEOUT)
+        self.ring.close()
@@ -1,161 +1,43 @@
 import sys
+import argparse
+import logging
+import multiprocessing
 import numpy as np
 import serial
 import threading
 import time
 from PyQt6.QtWidgets import (QApplication, QMainWindow, QWidget, QVBoxLayout, QHBoxLayout, 
                              QPushButton, QLabel, QGridLayout, QTableWidget, QTableWidgetItem, 
-                             QHeaderView, QLineEdit, QDialog, QFrame, QComboBox, QSizePolicy, QStackedLayout)
+                             QHeaderView, QLineEdit, QDialog, QFrame, QComboBox, QSizePolicy, QStackedLayout,
+                             QFileDialog)
 from PyQt6.QtCore import Qt, QTimer, pyqtSignal, QObject, QPointF, QPoint, QRect
-from PyQt6.QtGui import QColor, QPainter, QBrush, QPen, QLinearGradient, QDoubleValidator, QPalette, QPolygonF
-from matplotlib.backends.backend_qt5agg import FigureCanvasQTAgg as FigureCanvas
+from PyQt6.QtGui import (QColor, QPainter, QBrush, QPen, QLinearGradient, QDoubleValidator, QPolygonF,
+                         QKeySequence, QShortcut, QPalette)
+from matplotlib.backends.backend_qt5agg import FigureCanvasQTAgg as FigureCanvas, NavigationToolbar2QT as NavigationToolbar
 from matplotlib.figure import Figure
 import matplotlib as mpl
+from session import CHANNELS, open_catalog, SessionRecorder
+from history import RecentHistory, SeriesHistory, SessionHistory
+from export import FORMATS, TABLES, export_session, parse_list
+from analytics import LapAnalytics
+from ingest import ALERT_CHANNEL, POLICIES, QUEUE_SIZE, SERIAL_ERRORS, IngestProcess, IngestQueue, LineIngestor
+from metrics import REGISTRY, bucket_quantile
+from spectrum import BANDS, PEAK_CHANNEL, VIBRATION_RATE_HZ, Spectrogram, SpectrumAnalyzer
+from themes import ThemeManager, restyle
+
+log = logging.getLogger(__name__)
+
+PLOT_CHANNELS = ("motor_temp", "battery_temp", "energy")
+LIVE_VIEW_SECONDS = 600
+
+PLOT_SECONDS = REGISTRY.histogram("vts_plot_render_seconds", "Time to redraw the telemetry graphs", {"view": "graphs"})
+SPECTRUM_PLOT_SECONDS = REGISTRY.histogram("vts_plot_render_seconds", "Time to redraw the telemetry graphs", {"view": "spectrum"})
+POLL_SECONDS = REGISTRY.histogram("vts_gui_poll_seconds", "Time for the GUI to drain and display new samples")
+QUEUE_DEPTH = REGISTRY.gauge("vts_queue_depth", "Records waiting for the display")
+QUEUE_HIGH_WATER = REGISTRY.gauge("vts_queue_high_water", "Most records ever waiting for the display")
+QUEUE_DROPPED = REGISTRY.gauge("vts_queue_dropped", "Records the display skipped because it fell behind")
+QUEUE_LAG = REGISTRY.gauge("vts_queue_lag_seconds", "How far behind live the display was at its last update")
 
-class ThemeManager:
-    @staticmethod
-    def apply_dark_theme(app):
-        palette = app.palette()
-        palette.setColor(QPalette.ColorRole.Window, QColor(30, 30, 30))
-        palette.setColor(QPalette.ColorRole.WindowText, QColor(224, 224, 224))
-        palette.setColor(QPalette.ColorRole.Base, QColor(45, 45, 48))
-        palette.setColor(QPalette.ColorRole.Text, QColor(224, 224, 224))
-        palette.setColor(QPalette.ColorRole.Button, QColor(45, 45, 48))
-        palette.setColor(QPalette.ColorRole.ButtonText, QColor(224, 224, 224))
-        app.setPalette(palette)
-
-        app.setStyleSheet("""
-            QMainWindow, QDialog {
-                background-color: #1E1E1E;
-            }
-            QLabel {
-                color: #E0E0E0;
-                font-size: 14px;
-            }
-            QPushButton {
-                background-color: #0078D7;
-                color: white;
-                border: none;
-                padding: 8px;
-                min-width: 100px;
-                font-weight: bold;
-                font-size: 14px;
-            }
-            QLineEdit {
-                background-color: #333337;
-                color: #E0E0E0;
-                border: 1px solid #3F3F46;
-                padding: 6px;
-                min-height: 30px;
-                font-size: 14px;
-            }
-            QComboBox {
-                background-color: #333337;
-                color: #E0E0E0;
-                border: 1px solid #3F3F46;
-                padding: 6px;
-                min-height: 30px;
-                font-size: 14px;
-                border-radius: 4px;
-            }
-            QComboBox QAbstractItemView {
-                background-color: #333337;
-                color: #E0E0E0;
-                selection-background-color: #0078D7;
-                border: 1px solid #3F3F46;
-            }
-            QComboBox::drop-down {
-                border: none;
-            }
-            QTableWidget {
-                background-color: #252526;
-                color: #E0E0E0;
-                gridline-color: #3F3F46;
-                font-size: 14px;
-            }
-            QHeaderView::section {
-                background-color: #333337;
-                padding: 8px;
-                border: 1px solid #3F3F46;
-                font-size: 14px;
-            }
-            QFrame {
-                border: 1px solid #3F3F46;
-                border-radius: 5px;
-            }
-        """)
-
-    @staticmethod
-    def apply_light_theme(app):
-        palette = app.palette()
-        palette.setColor(QPalette.ColorRole.Window, QColor(240, 240, 240))
-        palette.setColor(QPalette.ColorRole.WindowText, QColor(0, 0, 0))
-        palette.setColor(QPalette.ColorRole.Base, QColor(255, 255, 255))
-        palette.setColor(QPalette.ColorRole.Text, QColor(0, 0, 0))
-        palette.setColor(QPalette.ColorRole.Button, QColor(240, 240, 240))
-        palette.setColor(QPalette.ColorRole.ButtonText, QColor(0, 0, 0))
-        app.setPalette(palette)
-
-        app.setStyleSheet("""
-            QMainWindow, QDialog {
-                background-color: #F5F5F5;
-            }
-            QLabel {
-                color: #333333;
-                font-size: 14px;
-            }
-            QPushButton {
-                background-color: #0078D7;
-                color: white;
-                border: none;
-                padding: 8px;
-                min-width: 100px;
-                font-weight: bold;
-                font-size: 14px;
-            }
-            QLineEdit {
-                background-color: #FFFFFF;
-                color: #333333;
-                border: 1px solid #CCCCCC;
-                padding: 6px;
-                min-height: 30px;
-                font-size: 14px;
-            }
-            QComboBox {
-                background-color: #FFFFFF;
-                color: #333333;
-                border: 1px solid #CCCCCC;
-                padding: 6px;
-                min-height: 30px;
-                font-size: 14px;
-                border-radius: 4px;
-            }
-            QComboBox QAbstractItemView {
-                background-color: #FFFFFF;
-                color: #333333;
-                selection-background-color: #0078D7;
-                border: 1px solid #CCCCCC;
-            }
-            QComboBox::drop-down {
-                border: none;
-            }
-            QTableWidget {
-                background-color: #FFFFFF;
-                color: #333333;
-                gridline-color: #CCCCCC;
-                font-size: 14px;
-            }
-            QHeaderView::section {
-                background-color: #F0F0F0;
-                padding: 8px;
-                border: 1px solid #CCCCCC;
-                font-size: 14px;
-            }
-            QFrame {
-                border: 1px solid #CCCCCC;
-                border-radius: 5px;
-            }
-        """)
 class TemperatureBar(QFrame):
     def __init__(self, parent=None):
         super().__init__(parent)
@@ -169,6 +51,14 @@ class TemperatureBar(QFrame):
             (60, 80, QColor(255, 255, 0)),   # Yellow
             (80, 100, QColor(255, 0, 0))     # Red
         ]
+        theme = ThemeManager.instance()
+        self.set_theme(theme.colors)
+        theme.theme_changed.connect(self.set_theme)
+
+    def set_theme(self, colors):
+        self.background_color = QColor(colors["bar_background"])
+        self.border_color = QColor(colors["bar_border"])
+        self.update()
         
     def setValue(self, value):
         self.value = min(max(0, value), self.maximum)
@@ -184,7 +74,7 @@ class TemperatureBar(QFrame):
         
         # Draw background
         painter.setPen(Qt.PenStyle.NoPen)
-        painter.setBrush(QBrush(QColor(60, 60, 60) if self.parent().dark_mode else QColor(220, 220, 220)))
+        painter.setBrush(QBrush(self.background_color))
         painter.drawRoundedRect(0, 0, width, height, 3, 3)
         
         # Draw filled segments with different colors
@@ -199,7 +89,7 @@ class TemperatureBar(QFrame):
                 x_pos += segment_width
         
         # Draw border
-        painter.setPen(QPen(QColor(100, 100, 100) if self.parent().dark_mode else QColor(180, 180, 180), 1))
+        painter.setPen(QPen(self.border_color, 1))
         painter.setBrush(Qt.BrushStyle.NoBrush)
         painter.drawRoundedRect(0, 0, width, height, 3, 3)
 
@@ -207,16 +97,15 @@ class TemperatureBar(QFrame):
 class TemperatureDisplay(QFrame):
     def __init__(self, title="Temperature", parent=None):
         super().__init__(parent)
-        self.dark_mode = True
         self.layout = QVBoxLayout(self)
         self.layout.setContentsMargins(10, 10, 10, 10)
         self.layout.setSpacing(5)
         
         self.title_label = QLabel(title)
-        self.title_label.setStyleSheet("font-weight: bold; font-size: 16px;")
+        self.title_label.setProperty("role", "heading")
         
         self.value_label = QLabel("0.0°C")
-        self.value_label.setStyleSheet("font-size: 18px;")
+        self.value_label.setProperty("role", "reading")
         
         self.bar = TemperatureBar()
         
@@ -227,19 +116,17 @@ class TemperatureDisplay(QFrame):
     def setValue(self, value):
         self.value_label.setText(f"{value:.1f}°C")
         self.bar.setValue(value)
-        
-    def setDarkMode(self, dark_mode):
-        self.dark_mode = dark_mode
-        self.bar.update()
+
 class SerialReader(QObject):
-    data_received = pyqtSignal(str)
-    
-    def __init__(self, port='COM1', baud_rate=9600):
+    def __init__(self, port='COM1', baud_rate=9600, queue_size=QUEUE_SIZE, policy="latest"):
         super().__init__()
         self.port = port
         self.baud_rate = baud_rate
         self.is_running = False
         self.ser = None
+        self.queue = IngestQueue(queue_size, policy)
+        self.ingestor = None
+        self.recent = None
         
     def connect_serial(self, port, baud_rate):
         try:
@@ -248,15 +135,20 @@ class SerialReader(QObject):
             self.ser = serial.Serial(self.port, self.baud_rate, timeout=1)
             return True
         except Exception as e:
-            print(f"Serial connection error: {e}")
+            SERIAL_ERRORS.inc()
+            log.error("Serial connection error: %s", e)
             return False
             
-    def start_reading(self):
+    def start_reading(self, recorder, spectrum=None, recent=None):
+        self.ingestor = LineIngestor(recorder, spectrum)
+        # The graphs' RAM tier gets every record; the queue policy only thins the displays
+        self.recent = recent
         self.is_running = True
         threading.Thread(target=self._read_serial, daemon=True).start()
         
     def stop_reading(self):
         self.is_running = False
+        self.queue.close()
         if self.ser and self.ser.is_open:
             self.ser.close()
             
@@ -266,89 +158,578 @@ class SerialReader(QObject):
                 if self.ser and self.ser.is_open and self.ser.in_waiting > 0:
                     line = self.ser.readline().decode('utf-8').strip()
                     if line:
-                        self.data_received.emit(line)
+                        for record in self.ingestor.ingest(line):
+                            if self.recent is not None:
+                                self.recent.add(*record)
+                            self.queue.put(record)
             except Exception as e:
-                print(f"Error reading serial: {e}")
+                SERIAL_ERRORS.inc()
+                log.error("Error reading serial: %s", e)
                 time.sleep(1)
 
 class GraphWindow(QDialog):
-    def __init__(self, parent=None):
+    def __init__(self, parent, history, title="Telemetry Graphs", view=None, live=False, analytics=None):
         super().__init__(parent)
-        self.setWindowTitle("Telemetry Graphs")
+        self.setWindowTitle(title)
         self.setGeometry(150, 150, 1000, 800)
         self.parent = parent
+        # history serves any time range; the plots only ever hold what is on screen
+        self.history = history
+        self.live = live
+        self.following = live
+        self.view = None
+        self.setting_view = False
         
         layout = QVBoxLayout()
         self.setLayout(layout)
         
         self.figure = Figure(figsize=(10, 8))
         self.canvas = FigureCanvas(self.figure)
+        layout.addWidget(NavigationToolbar(self.canvas, self))
         layout.addWidget(self.canvas)
-        
-        self.update_graphs()
+
+        buttons_layout = QHBoxLayout()
+        whole_button = QPushButton("Whole Session")
+        whole_button.clicked.connect(self.show_whole_session)
+        buttons_layout.addWidget(whole_button)
+        if live:
+            follow_button = QPushButton("Follow Live")
+            follow_button.clicked.connect(self.follow_live)
+            buttons_layout.addWidget(follow_button)
+        if analytics is not None:
+            overlay_button = QPushButton("Lap Overlay")
+            overlay_button.clicked.connect(lambda: LapOverlayWindow(self, analytics).exec())
+            buttons_layout.addWidget(overlay_button)
+        layout.addLayout(buttons_layout)
+
+        self.ax1 = self.figure.add_subplot(211)
+        self.ax2 = self.figure.add_subplot(212, sharex=self.ax1)
+
+        # Temperature plot
+        self.motor_line, = self.ax1.plot([], [], color='#FF5555', linewidth=2, label='Motor Temp')
+        self.battery_line, = self.ax1.plot([], [], color='#55AAFF', linewidth=2, label='Battery Temp')
+        self.ax1.set_xlabel('Time (s)')
+        self.ax1.set_ylabel('Temperature (°C)')
+        self.ax1.set_title('Temperature vs Time')
+        self.legend = self.ax1.legend()
+
+        # Energy plot
+        self.energy_line, = self.ax2.plot([], [], color='#00CC66', linewidth=2, drawstyle='steps-post')
+        self.energy_fill = None
+        self.ax2.set_xlabel('Time (s)')
+        self.ax2.set_ylabel('Remaining Energy (Ah)')
+        self.ax2.set_title('Remaining Energy vs Time')
+
+        theme = ThemeManager.instance()
+        self.apply_theme(theme.colors)
+        theme.follow(self, self.apply_theme)
+        self.figure.tight_layout()
+
+        # Zooming and panning fire many limit changes; only the last one is loaded
+        self.reload_timer = QTimer(self)
+        self.reload_timer.setSingleShot(True)
+        self.reload_timer.timeout.connect(self.update_graphs)
+        for ax in [self.ax1, self.ax2]:
+            ax.callbacks.connect('xlim_changed', self.view_changed)
+
+        # Either end of the requested view may be left open (None)
+        span = history.span(PLOT_CHANNELS) or (0, LIVE_VIEW_SECONDS)
+        if live:
+            span = (max(span[0], span[1] - LIVE_VIEW_SECONDS), span[1])
+        view = view or (None, None)
+        self.set_view(span[0] if view[0] is None else view[0], span[1] if view[1] is None else view[1])
+        self.finished.connect(history.close)
+
         self.update_timer = QTimer(self)
-        self.update_timer.timeout.connect(self.update_graphs)
-        self.update_timer.start(500)
+        self.update_timer.timeout.connect(self.follow_update)
+        if live:
+            self.update_timer.start(500)
+        # A closed window stops redrawing and is deleted along with its figure
+        self.finished.connect(self.update_timer.stop)
+        self.finished.connect(self.reload_timer.stop)
+        self.setAttribute(Qt.WidgetAttribute.WA_DeleteOnClose)
 
-    def update_graphs(self):
-        self.figure.clear()
-        
-        if self.parent.dark_mode:
-            bg_color = '#2D2D30'
-            text_color = '#E0E0E0'
-            grid_color = '#3F3F46'
-        else:
-            bg_color = '#FFFFFF'
-            text_color = '#333333'
-            grid_color = '#CCCCCC'
-            
+    def apply_theme(self, colors):
+        bg_color = colors["plot_background"]
+        text_color = colors["plot_text"]
+        grid_color = colors["plot_grid"]
         self.figure.set_facecolor(bg_color)
-        
-        timestamps = self.parent.timestamps
-        motor_temps = self.parent.motor_temps
-        battery_temps = self.parent.battery_temps
-        energy_data = self.parent.energy_data
-        
-        ax1 = self.figure.add_subplot(211)
-        ax2 = self.figure.add_subplot(212)
-        
-        ax1.set_facecolor(bg_color)
-        ax2.set_facecolor(bg_color)
-        
-        for ax in [ax1, ax2]:
-            ax.spines['bottom'].set_color(text_color)
-            ax.spines['top'].set_color(text_color) 
-            ax.spines['right'].set_color(text_color)
-            ax.spines['left'].set_color(text_color)
+        for ax in [self.ax1, self.ax2]:
+            ax.set_facecolor(bg_color)
+            for spine in ax.spines.values():
+                spine.set_color(text_color)
             ax.tick_params(axis='x', colors=text_color)
             ax.tick_params(axis='y', colors=text_color)
             ax.xaxis.label.set_color(text_color)
             ax.yaxis.label.set_color(text_color)
             ax.title.set_color(text_color)
             ax.grid(True, color=grid_color, linestyle='--', alpha=0.5)
-        
-        # Temperature plot
-        ax1.plot(timestamps, motor_temps, color='#FF5555', linewidth=2, label='Motor Temp')
-        ax1.plot(timestamps, battery_temps, color='#55AAFF', linewidth=2, label='Battery Temp')
-        ax1.set_xlabel('Time (s)')
-        ax1.set_ylabel('Temperature (°C)')
-        ax1.set_title('Temperature vs Time')
-        legend1 = ax1.legend()
-        frame1 = legend1.get_frame()
-        frame1.set_facecolor(bg_color)
-        frame1.set_edgecolor(text_color)
-        for text in legend1.get_texts():
+        frame = self.legend.get_frame()
+        frame.set_facecolor(bg_color)
+        frame.set_edgecolor(text_color)
+        for text in self.legend.get_texts():
             text.set_color(text_color)
-        
-        # Energy plot
-        ax2.plot(timestamps, energy_data, color='#00CC66', linewidth=2)
-        ax2.fill_between(timestamps, energy_data, color='#00CC66', alpha=0.2)
-        ax2.set_xlabel('Time (s)')
-        ax2.set_ylabel('Remaining Energy (Ah)')
-        ax2.set_title('Remaining Energy vs Time')
-        
+        self.canvas.draw_idle()
+
+    def set_view(self, t0, t1):
+        self.setting_view = True
+        self.ax1.set_xlim(t0, t1 if t1 > t0 else t0 + 1)
+        self.setting_view = False
+        self.reload_timer.stop()
+        self.update_graphs()
+
+    def view_changed(self, ax):
+        # Zooming or panning by hand stops the view from following live data
+        if not self.setting_view:
+            self.following = False
+        self.reload_timer.start(30)
+
+    def show_whole_session(self):
+        self.following = False
+        span = self.history.span(PLOT_CHANNELS)
+        if span is not None:
+            self.set_view(*span)
+
+    def follow_live(self):
+        self.following = True
+        self.follow_update()
+
+    def follow_update(self):
+        span = self.history.span(PLOT_CHANNELS)
+        if not self.following or span is None:
+            return
+        t0, t1 = self.ax1.get_xlim()
+        self.set_view(span[1] - (t1 - t0), span[1])
+
+    def update_graphs(self):
+        with PLOT_SECONDS.time():
+            self.draw_graphs()
+
+    def draw_graphs(self):
+        t0, t1 = self.ax1.get_xlim()
+        # Data half a screen either side is loaded too, so a short pan never shows a gap
+        margin = (t1 - t0) / 2
+        direction = 0
+        if self.view is not None and np.isclose(t1 - t0, self.view[1] - self.view[0]):
+            direction = np.sign(t0 - self.view[0])
+        self.view = (t0, t1)
+
+        for line, channel in ((self.motor_line, "motor_temp"), (self.battery_line, "battery_temp"),
+                              (self.energy_line, "energy")):
+            line.set_data(*self.history.window(channel, t0 - margin, t1 + margin))
+        if self.energy_fill is not None:
+            self.energy_fill.remove()
+        self.energy_fill = self.ax2.fill_between(*self.energy_line.get_data(), step='post',
+                                                 color='#00CC66', alpha=0.2)
+        for ax in [self.ax1, self.ax2]:
+            ax.relim()
+            ax.autoscale_view(scalex=False)
+        self.canvas.draw_idle()
+        if not self.following:
+            self.history.prefetch(PLOT_CHANNELS, t0, t1, direction)
+
+class LapOverlayWindow(QDialog):
+    def __init__(self, parent, analytics):
+        super().__init__(parent)
+        self.setWindowTitle("Lap Overlay")
+        self.setGeometry(170, 170, 1000, 900)
+        self.analytics = analytics
+        analytics.update()
+
+        layout = QVBoxLayout()
+        self.setLayout(layout)
+
+        controls = QHBoxLayout()
+        self.channel_combo = QComboBox()
+        self.channel_combo.addItems(analytics.channels)
+        self.channel_combo.currentIndexChanged.connect(self.redraw)
+        self.reference_combo = QComboBox()
+        self.reference_combo.currentIndexChanged.connect(self.redraw)
+        channel_label = QLabel("Channel:")
+        channel_label.setProperty("role", "field")
+        reference_label = QLabel("Reference lap:")
+        reference_label.setProperty("role", "field")
+        controls.addWidget(channel_label)
+        controls.addWidget(self.channel_combo)
+        controls.addWidget(reference_label)
+        controls.addWidget(self.reference_combo)
+        layout.addLayout(controls)
+
+        self.figure = Figure(figsize=(10, 6))
+        self.canvas = FigureCanvas(self.figure)
+        layout.addWidget(self.canvas)
+        self.overlay_ax = self.figure.add_subplot(211)
+        self.delta_ax = self.figure.add_subplot(212, sharex=self.overlay_ax)
+
+        self.summary_table = QTableWidget()
+        self.summary_table.setColumnCount(7)
+        self.summary_table.setHorizontalHeaderLabels(
+            ["Lap #", "Time Taken", "Δ Time", "Energy Used", "Δ Energy", "Max", "Δ Max"])
+        self.summary_table.horizontalHeader().setSectionResizeMode(QHeaderView.ResizeMode.Stretch)
+        self.summary_table.setEditTriggers(QTableWidget.EditTrigger.NoEditTriggers)
+        self.summary_table.setMinimumHeight(180)
+        layout.addWidget(self.summary_table)
+
+        self.refresh_laps()
+        theme = ThemeManager.instance()
+        theme.follow(self, self.apply_theme)
+        self.apply_theme(theme.colors)
+
+        # Only laps finished (or overlapped by a new pit stop) since the last tick are profiled
+        self.update_timer = QTimer(self)
+        self.update_timer.timeout.connect(self.poll_laps)
+        self.update_timer.start(2000)
+        self.finished.connect(self.update_timer.stop)
+        self.setAttribute(Qt.WidgetAttribute.WA_DeleteOnClose)
+
+    def refresh_laps(self):
+        reference = self.reference_combo.currentData()
+        self.reference_combo.blockSignals(True)
+        self.reference_combo.clear()
+        for lap in self.analytics.lap_numbers():
+            self.reference_combo.addItem(f"Lap {lap}", lap)
+        if reference is None:
+            reference = self.analytics.fastest_lap()
+        index = self.reference_combo.findData(reference)
+        self.reference_combo.setCurrentIndex(max(index, 0))
+        self.reference_combo.blockSignals(False)
+
+    def poll_laps(self):
+        if self.analytics.update():
+            self.refresh_laps()
+            self.redraw()
+
+    def apply_theme(self, colors):
+        self.colors = colors
+        self.redraw()
+
+    def redraw(self):
+        bg_color = self.colors["plot_background"]
+        text_color = self.colors["plot_text"]
+        grid_color = self.colors["plot_grid"]
+        channel = self.channel_combo.currentText()
+        reference = self.reference_combo.currentData()
+        laps = self.analytics.lap_numbers()
+        progress = self.analytics.grid * 100
+
+        self.figure.set_facecolor(bg_color)
+        for ax in [self.overlay_ax, self.delta_ax]:
+            ax.clear()
+            ax.set_facecolor(bg_color)
+            for spine in ax.spines.values():
+                spine.set_color(text_color)
+            ax.tick_params(axis='x', colors=text_color)
+            ax.tick_params(axis='y', colors=text_color)
+            ax.xaxis.label.set_color(text_color)
+            ax.yaxis.label.set_color(text_color)
+            ax.title.set_color(text_color)
+            ax.grid(True, color=grid_color, linestyle='--', alpha=0.5)
+
+        if laps and reference is not None:
+            colors = mpl.colormaps['viridis'](np.linspace(0, 1, len(laps)))
+            curves = self.analytics.matrix(channel)
+            deltas = self.analytics.deltas(channel, reference)
+            for lap, color, curve, delta in zip(laps, colors, curves, deltas):
+                is_reference = lap == reference
+                style = {"color": text_color if is_reference else color,
+                         "linewidth": 2.5 if is_reference else 1.2}
+                self.overlay_ax.plot(progress, curve, label=f"Lap {lap}", **style)
+                self.delta_ax.plot(progress, delta, **style)
+            legend = self.overlay_ax.legend(fontsize='small', ncol=max(1, len(laps) // 10))
+            legend.get_frame().set_facecolor(bg_color)
+            legend.get_frame().set_edgecolor(text_color)
+            for text in legend.get_texts():
+                text.set_color(text_color)
+
+        self.overlay_ax.set_title(f'{channel} by Lap')
+        self.overlay_ax.set_ylabel(channel)
+        self.delta_ax.set_title(f'Difference from Lap {reference}' if reference is not None else 'Difference')
+        self.delta_ax.set_xlabel('Lap progress (%, pit stops removed)')
+        self.delta_ax.set_ylabel('Δ ' + channel)
         self.figure.tight_layout()
-        self.canvas.draw()
+        self.canvas.draw_idle()
+        self.update_summary(channel, reference)
+
+    def update_summary(self, channel, reference):
+        self.summary_table.setRowCount(0)
+        for row_position, row in enumerate(self.analytics.summary(reference)):
+            self.summary_table.insertRow(row_position)
+            cells = [str(row["lap"]), "%02d:%02d" % divmod(row["duration"], 60),
+                     f"{row.get('delta_duration', 0):+d} s", f"{row['energy_used']:.2f} Ah",
+                     f"{row.get('delta_energy', 0):+.2f} Ah",
+                     f"{row[channel + '_max']:.1f}" if channel + '_max' in row else "--",
+                     f"{row[channel + '_max_delta']:+.1f}" if channel + '_max_delta' in row else "--"]
+            for column, text in enumerate(cells):
+                self.summary_table.setItem(row_position, column, QTableWidgetItem(text))
+
+class SpectrogramWindow(QDialog):
+    def __init__(self, parent, spectrogram):
+        super().__init__(parent)
+        self.setWindowTitle("Vibration Spectrum")
+        self.setGeometry(150, 150, 1000, 800)
+        self.parent = parent
+        self.spectrogram = spectrogram
+
+        layout = QVBoxLayout()
+        self.setLayout(layout)
+
+        self.figure = Figure(figsize=(10, 8))
+        self.canvas = FigureCanvas(self.figure)
+        layout.addWidget(self.canvas)
+
+        self.waterfall_ax = self.figure.add_subplot(211)
+        self.bands_ax = self.figure.add_subplot(212)
+        freqs = spectrogram.freqs
+        waterfall, band_energy, peak_hz = spectrogram.snapshot()
+        self.image = self.waterfall_ax.imshow(
+            waterfall.T, aspect='auto', origin='lower', cmap='inferno',
+            extent=(-len(waterfall), 0, freqs[0], freqs[-1]), vmin=-80, vmax=0)
+        self.waterfall_ax.set_xlabel('Windows ago')
+        self.waterfall_ax.set_ylabel('Frequency (Hz)')
+        self.waterfall_ax.set_title('Vibration Spectrogram')
+        self.figure.colorbar(self.image, ax=self.waterfall_ax, label='Power (dB)')
+
+        labels = [f"{lo}-{hi} Hz" for lo, hi in BANDS]
+        self.bars = self.bands_ax.bar(labels, band_energy, color='#FFAA00')
+        self.bands_ax.set_ylabel('Band Energy')
+        self.bands_ax.set_title('Band Energies')
+        theme = ThemeManager.instance()
+        self.apply_theme(theme.colors)
+        theme.follow(self, self.apply_theme)
+
+        self.update_spectrum()
+        self.update_timer = QTimer(self)
+        self.update_timer.timeout.connect(self.update_spectrum)
+        self.update_timer.start(500)
+        self.finished.connect(self.update_timer.stop)
+        self.setAttribute(Qt.WidgetAttribute.WA_DeleteOnClose)
+
+    def apply_theme(self, colors):
+        bg_color = colors["plot_background"]
+        text_color = colors["plot_text"]
+        self.figure.set_facecolor(bg_color)
+        for ax in [self.waterfall_ax, self.bands_ax]:
+            ax.set_facecolor(bg_color)
+            for spine in ax.spines.values():
+                spine.set_color(text_color)
+            ax.tick_params(axis='x', colors=text_color)
+            ax.tick_params(axis='y', colors=text_color)
+            ax.xaxis.label.set_color(text_color)
+            ax.yaxis.label.set_color(text_color)
+            ax.title.set_color(text_color)
+
+    def update_spectrum(self):
+        # Only the artists' data changes, the figure is never rebuilt
+        with SPECTRUM_PLOT_SECONDS.time():
+            waterfall, band_energy, peak_hz = self.spectrogram.snapshot()
+            self.image.set_data(waterfall.T)
+            for bar, energy in zip(self.bars, band_energy):
+                bar.set_height(energy)
+            self.bands_ax.relim()
+            self.bands_ax.autoscale_view()
+            self.bands_ax.set_xlabel(f"Dominant frequency: {peak_hz:.1f} Hz")
+            self.canvas.draw()
+
+class SessionPickerDialog(QDialog):
+    def __init__(self, parent, catalog):
+        super().__init__(parent)
+        self.setWindowTitle("Recorded Sessions")
+        self.setGeometry(200, 200, 800, 500)
+        self.parent = parent
+        self.catalog = catalog
+
+        layout = QVBoxLayout(self)
+
+        self.session_combo = QComboBox()
+        for row in catalog.sessions():
+            started = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(row["started_at"]))
+            self.session_combo.addItem(f"#{row['id']}  {started}", row["id"])
+        self.session_combo.currentIndexChanged.connect(self.refresh_laps)
+        layout.addWidget(self.session_combo)
+
+        self.lap_table = QTableWidget()
+        self.lap_table.setColumnCount(5)
+        self.lap_table.setHorizontalHeaderLabels(["Lap #", "Time Taken", "Energy Used", "Max Motor Temp", "Max Battery Temp"])
+        self.lap_table.horizontalHeader().setSectionResizeMode(QHeaderView.ResizeMode.Stretch)
+        self.lap_table.setSelectionBehavior(QTableWidget.SelectionBehavior.SelectRows)
+        self.lap_table.setEditTriggers(QTableWidget.EditTrigger.NoEditTriggers)
+        self.lap_table.cellDoubleClicked.connect(lambda row, column: self.load_selected_lap())
+        layout.addWidget(self.lap_table)
+
+        range_layout = QHBoxLayout()
+        self.range_start = QLineEdit()
+        self.range_start.setPlaceholderText("From (s)")
+        self.range_start.setValidator(QDoubleValidator(0, 1e9, 1))
+        self.range_end = QLineEdit()
+        self.range_end.setPlaceholderText("To (s)")
+        self.range_end.setValidator(QDoubleValidator(0, 1e9, 1))
+        load_range_button = QPushButton("Load Range")
+        load_range_button.clicked.connect(self.load_selected_range)
+        load_lap_button = QPushButton("Load Lap")
+        load_lap_button.clicked.connect(self.load_selected_lap)
+        compare_button = QPushButton("Compare Laps")
+        compare_button.clicked.connect(self.compare_laps)
+        range_layout.addWidget(self.range_start)
+        range_layout.addWidget(self.range_end)
+        range_layout.addWidget(load_range_button)
+        range_layout.addWidget(load_lap_button)
+        range_layout.addWidget(compare_button)
+        layout.addLayout(range_layout)
+
+        export_layout = QHBoxLayout()
+        self.channels_input = QLineEdit()
+        self.channels_input.setPlaceholderText("Channels to export, comma separated (default: all)")
+        self.format_combo = QComboBox()
+        self.format_combo.addItems(FORMATS)
+        export_button = QPushButton("Export")
+        export_button.clicked.connect(self.export_selected)
+        export_layout.addWidget(self.channels_input)
+        export_layout.addWidget(self.format_combo)
+        export_layout.addWidget(export_button)
+        layout.addLayout(export_layout)
+        self.export_status = QLabel("")
+        layout.addWidget(self.export_status)
+        self.export_task = None
+
+        self.refresh_laps()
+
+    def session_id(self):
+        return self.session_combo.currentData()
+
+    def refresh_laps(self):
+        self.lap_table.setRowCount(0)
+        if self.session_id() is None:
+            return
+        for row_position, lap in enumerate(self.catalog.laps(self.session_id())):
+            stats = {row["channel"]: row for row in self.catalog.lap_stats(lap["session_id"], lap["lap"])}
+            self.lap_table.insertRow(row_position)
+            self.lap_table.setItem(row_position, 0, QTableWidgetItem(str(lap["lap"])))
+            self.lap_table.setItem(row_position, 1, QTableWidgetItem(self.parent.format_time(lap["duration"])))
+            self.lap_table.setItem(row_position, 2, QTableWidgetItem(f"{lap['energy_used']:.2f} Ah"))
+            for column, channel in ((3, "motor_temp"), (4, "battery_temp")):
+                text = f"{stats[channel]['max']:.1f}°C" if channel in stats else "--"
+                self.lap_table.setItem(row_position, column, QTableWidgetItem(text))
+
+    def load_selected_lap(self):
+        row = self.lap_table.currentRow()
+        if self.session_id() is None or row < 0:
+            return
+        lap = self.catalog.lap(self.session_id(), int(self.lap_table.item(row, 0).text()))
+        self.show_history((lap["start_t"], lap["end_t"]), f"Session #{self.session_id()} - Lap {lap['lap']}")
+
+    def compare_laps(self):
+        if self.session_id() is None:
+            return
+        LapOverlayWindow(self, LapAnalytics(self.catalog, self.session_id())).exec()
+
+    def selected_range(self):
+        t0 = float(self.range_start.text()) if self.range_start.text() else None
+        t1 = float(self.range_end.text()) if self.range_end.text() else None
+        return t0, t1
+
+    def load_selected_range(self):
+        if self.session_id() is None:
+            return
+        self.show_history(self.selected_range(), f"Session #{self.session_id()} - {self.range_start.text() or 'start'} to {self.range_end.text() or 'end'} s")
+
+    def show_history(self, view, title):
+        # Opens on the requested range, but the whole session can be zoomed and panned from there
+        history = SessionHistory(self.catalog.session(self.session_id())["path"])
+        analytics = LapAnalytics(self.catalog, self.session_id())
+        graph_window = GraphWindow(self.parent, history, title=title, view=view, analytics=analytics)
+        graph_window.exec()
+
+    def export_selected(self):
+        # Exports the selected session, limited to the range and channels entered
+        if self.session_id() is None or (self.export_task is not None and self.export_task.running):
+            return
+        directory = QFileDialog.getExistingDirectory(self, "Export Session To")
+        if not directory:
+            return
+        t0, t1 = self.selected_range()
+        channels = parse_list(self.channels_input.text()) or CHANNELS
+        self.export_task = ExportTask(self.catalog, self.session_id(), directory,
+                                      self.format_combo.currentText(), channels, t0, t1)
+        self.export_task.done.connect(self.export_status.setText)
+        self.export_status.setText(f"Exporting session #{self.session_id()}...")
+        self.export_task.start()
+
+class ExportTask(QObject):
+    # Runs an export off the GUI thread; large sessions take a while to stream out
+    done = pyqtSignal(str)
+
+    def __init__(self, catalog, session_id, directory, fmt, channels, t0, t1):
+        super().__init__()
+        self.args = (catalog, session_id, directory, fmt, channels, TABLES, t0, t1)
+        self.directory = directory
+        self.running = False
+
+    def start(self):
+        self.running = True
+        threading.Thread(target=self.run, daemon=True).start()
+
+    def run(self):
+        try:
+            written = export_session(*self.args)
+            self.done.emit(f"Exported {sum(written.values())} rows to {self.directory}")
+        except (ValueError, KeyError, RuntimeError, OSError) as e:
+            log.error("Export failed: %s", e)
+            self.done.emit(f"Export failed: {e}")
+        finally:
+            self.running = False
+
+class MetricsHud(QLabel):
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.setProperty("role", "hud")
+        self.setAttribute(Qt.WidgetAttribute.WA_TransparentForMouseEvents)
+        self.previous = {}
+        self.previous_time = time.monotonic()
+        # Only refreshes while visible, so a hidden HUD costs nothing
+        self.refresh_timer = QTimer(self)
+        self.refresh_timer.timeout.connect(self.refresh)
+        self.hide()
+
+    def toggle(self):
+        if self.isVisible():
+            self.refresh_timer.stop()
+            self.hide()
+        else:
+            self.refresh()
+            self.show()
+            self.raise_()
+            self.refresh_timer.start(1000)
+
+    def refresh(self):
+        now = time.monotonic()
+        elapsed = max(now - self.previous_time, 1e-9)
+        self.previous_time = now
+        lines = []
+        for name, (kind, help, samples) in sorted(REGISTRY.merged().items()):
+            if kind == "histogram":
+                series = {}
+                for suffix, labels, value in samples:
+                    key = tuple(label for label in labels if label[0] != "le")
+                    if suffix == "_bucket":
+                        bound = dict(labels)["le"]
+                        series.setdefault(key, []).append((float("inf") if bound == "+Inf" else float(bound), value))
+                for key, buckets in series.items():
+                    p50 = bucket_quantile(buckets, 0.5) * 1000
+                    p99 = bucket_quantile(buckets, 0.99) * 1000
+                    lines.append(f"{name}{self.format_labels(key)}  p50 {p50:.2f} ms  p99 {p99:.2f} ms  n={buckets[-1][1]}")
+            else:
+                for suffix, labels, value in samples:
+                    line = f"{name}{self.format_labels(labels)}  {value:g}"
+                    if kind == "counter":
+                        rate = (value - self.previous.get((name, labels), value)) / elapsed
+                        self.previous[(name, labels)] = value
+                        line += f"  ({rate:.1f}/s)"
+                    lines.append(line)
+        self.setText("\n".join(lines))
+        self.adjustSize()
+
+    def format_labels(self, labels):
+        return "{" + ",".join(f"{key}={value}" for key, value in labels) + "}" if labels else ""
 
 class DecorativeTriangles(QWidget):
     def __init__(self, parent=None):
@@ -399,13 +780,15 @@ class DecorativeTriangles(QWidget):
             painter.restore()
 
 class TelemetryApp(QMainWindow):
-    def __init__(self):
+    def __init__(self, ingest_process=False, ingest_policy="latest", ingest_queue_size=QUEUE_SIZE,
+                 vibration_rate=VIBRATION_RATE_HZ, vibration_band_limits=None):
         super().__init__()
         self.setWindowTitle("VTS Dashboard")
         self.setGeometry(100, 100, 1000, 800)
         
         self.dark_mode = True
-        ThemeManager.apply_dark_theme(QApplication.instance())
+        self.theme = ThemeManager(QApplication.instance())
+        self.theme.apply_dark_theme()
         
         self.heat_time_seconds = 30 * 60  
         self.last_lap_time = self.heat_time_seconds
@@ -415,23 +798,33 @@ class TelemetryApp(QMainWindow):
         self.battery_temp = 25
         self.vibration = 20
         self.warning_active = False
-        self.timestamps = []
-        self.motor_temps = []
-        self.battery_temps = []
-        self.energy_data = []
-        self.elapsed_time = 0  
+        # Recent samples for the graphs; older ones are paged in from the session file
+        self.recent = RecentHistory(PLOT_CHANNELS)
+        self.lap_analytics = None
+
+        self.catalog = open_catalog()
+        self.recorder = None
+        # Run serial reading, parsing, alerting and recording in a child process
+        self.ingest_process = ingest_process
 
-        self.serial_reader = SerialReader()
-        self.serial_reader.data_received.connect(self.process_serial_data)
+        self.serial_reader = SerialReader(queue_size=ingest_queue_size, policy=ingest_policy)
+        self.spectrum_options = {"sample_rate": vibration_rate, "band_limits": vibration_band_limits}
+        # Whichever process analyses the vibration stream publishes each window here
+        self.spectrogram = Spectrogram(sample_rate=vibration_rate)
+        self.spectrum = SpectrumAnalyzer(**self.spectrum_options, display=self.spectrogram)
 
         self.init_ui()
+
+        self.metrics_hud = MetricsHud(self)
+        self.metrics_hud.move(15, 15)
+        QShortcut(QKeySequence("F3"), self).activated.connect(self.metrics_hud.toggle)
         
         self.timer = QTimer(self)
         self.timer.timeout.connect(self.update_timer)
         self.warning_timer = QTimer(self)
         self.warning_timer.timeout.connect(self.toggle_warning)
-        self.data_timer = QTimer(self)
-        self.data_timer.timeout.connect(self.collect_data_point)
+        self.ingest_timer = QTimer(self)
+        self.ingest_timer.timeout.connect(self.poll_ingest)
         
     def init_ui(self):
         central_widget = QWidget()
@@ -441,16 +834,11 @@ class TelemetryApp(QMainWindow):
 
         title_bar = QHBoxLayout()
         self.title_label = QLabel("⚡ VTS Dashboard")
-        self.title_label.setStyleSheet("font-size: 28px; font-weight: bold;")
+        self.title_label.setProperty("role", "title")
         
         self.theme_button = QPushButton("🌙")  # Default moon icon
         self.theme_button.setFixedSize(60, 60)  # Increased from 40x40 to 60x60
-        self.theme_button.setStyleSheet("""
-            border: none; 
-            background: transparent; 
-            font-size: 30px;  /* Increased from 20px */
-            padding: 0px;
-        """)
+        self.theme_button.setProperty("role", "theme-toggle")
         self.theme_button.clicked.connect(self.toggle_theme)
         
         title_bar.addWidget(self.title_label)
@@ -464,32 +852,37 @@ class TelemetryApp(QMainWindow):
         serial_layout.setContentsMargins(10, 10, 10, 10)
         
         port_label = QLabel("Port:")
-        port_label.setStyleSheet("font-weight: bold;")
+        port_label.setProperty("role", "field")
         self.port_combo = QComboBox()
         self.port_combo.addItems([f"COM{i}" for i in range(1, 11)])
         self.port_combo.setCurrentText("COM1")
         
         baud_label = QLabel("Baud:")
-        baud_label.setStyleSheet("font-weight: bold;")
+        baud_label.setProperty("role", "field")
         self.baud_combo = QComboBox()
         self.baud_combo.addItems(["9600", "19200", "38400", "57600", "115200"])
         self.baud_combo.setCurrentText("9600")
         
         self.connect_button = QPushButton("Connect Serial")
         self.connect_button.clicked.connect(self.connect_serial)
-        self.connect_button.setStyleSheet("min-width: 120px;")
+        self.connect_button.setProperty("role", "action")
+
+        self.ingest_status_label = QLabel("")
         
         serial_layout.addWidget(port_label)
         serial_layout.addWidget(self.port_combo)
         serial_layout.addWidget(baud_label)
         serial_layout.addWidget(self.baud_combo)
         serial_layout.addWidget(self.connect_button)
+        serial_layout.addWidget(self.ingest_status_label)
         main_layout.addWidget(serial_frame)
 
         # Timer display
         self.timer_label = QLabel(self.format_time(self.heat_time_seconds))
         self.timer_label.setAlignment(Qt.AlignmentFlag.AlignCenter)
-        self.timer_label.setStyleSheet("font-size: 48px; font-weight: bold; color: #FFDD00;")
+        self.timer_label.setProperty("role", "timer")
+        self.set_timer_color(self.theme.colors)
+        self.theme.theme_changed.connect(self.set_timer_color)
         main_layout.addWidget(self.timer_label)
 
         # Temperature displays 
@@ -517,28 +910,32 @@ class TelemetryApp(QMainWindow):
         telemetry_layout.setSpacing(15)
 
         self.vibration_label = QLabel("Vibration Level: 20")
-        self.vibration_label.setStyleSheet("font-size: 18px; font-weight: bold;")
+        self.vibration_label.setProperty("role", "metric")
         
         self.remaining_energy_label = QLabel(f"Remaining Energy: {self.remaining_energy} Ah")
-        self.remaining_energy_label.setStyleSheet("font-size: 18px; font-weight: bold;")
+        self.remaining_energy_label.setProperty("role", "metric")
         
         self.energy_input = QLineEdit()
         self.energy_input.setPlaceholderText("Enter Remaining Energy (Ah)")
         self.energy_input.setValidator(QDoubleValidator(0, 100, 2))
-        self.energy_input.setStyleSheet("font-size: 16px;")
+        self.energy_input.setProperty("role", "entry")
         
         self.warning_box = QFrame()
         self.warning_box.setFixedSize(40, 40)
-        self.warning_box.setStyleSheet("border: 3px solid red; background: transparent;")
+        self.warning_box.setProperty("role", "warning")
         
         self.lap_count_label = QLabel(f"Lap Count: {self.lap_count}")
-        self.lap_count_label.setStyleSheet("font-size: 18px; font-weight: bold;")
+        self.lap_count_label.setProperty("role", "metric")
+
+        self.vibration_peak_label = QLabel("Dominant Vibration: -- Hz")
+        self.vibration_peak_label.setProperty("role", "metric")
         
         telemetry_layout.addWidget(self.vibration_label, 0, 0)
         telemetry_layout.addWidget(self.remaining_energy_label, 0, 1)
         telemetry_layout.addWidget(self.energy_input, 1, 0)
         telemetry_layout.addWidget(self.warning_box, 1, 1, Qt.AlignmentFlag.AlignRight)
-        telemetry_layout.addWidget(self.lap_count_label, 2, 0, 1, 2)
+        telemetry_layout.addWidget(self.lap_count_label, 2, 0)
+        telemetry_layout.addWidget(self.vibration_peak_label, 2, 1)
         
         main_layout.addWidget(telemetry_frame)
 
@@ -548,19 +945,22 @@ class TelemetryApp(QMainWindow):
         
         self.start_button = QPushButton("Start Timer")
         self.start_button.clicked.connect(self.start_timer)
-        self.start_button.setStyleSheet("background-color: #00A86B; min-width: 120px;")
+        self.start_button.setProperty("role", "action")
+        self.start_button.setProperty("tone", "green")
         
         self.pause_button = QPushButton("Pause Timer")
         self.pause_button.clicked.connect(self.pause_timer)
-        self.pause_button.setStyleSheet("background-color: #FF8C00; min-width: 120px;")
+        self.pause_button.setProperty("role", "action")
+        self.pause_button.setProperty("tone", "orange")
         
         self.lap_button = QPushButton("Record Lap")
         self.lap_button.clicked.connect(self.record_lap)
-        self.lap_button.setStyleSheet("background-color: #0078D7; min-width: 120px;")
+        self.lap_button.setProperty("role", "action")
         
         self.pit_stop_button = QPushButton("Pit Stop")
         self.pit_stop_button.clicked.connect(self.pit_stop)
-        self.pit_stop_button.setStyleSheet("background-color: #E74856; min-width: 120px;")
+        self.pit_stop_button.setProperty("role", "action")
+        self.pit_stop_button.setProperty("tone", "red")
         
         buttons_layout.addWidget(self.start_button)
         buttons_layout.addWidget(self.pause_button)
@@ -571,9 +971,22 @@ class TelemetryApp(QMainWindow):
         # Graphs button
         self.show_graphs_button = QPushButton("Show Graphs")
         self.show_graphs_button.clicked.connect(self.show_graphs)
-        self.show_graphs_button.setStyleSheet("background-color: #8A2BE2; min-width: 120px;")
+        self.show_graphs_button.setProperty("role", "action")
+        self.show_graphs_button.setProperty("tone", "purple")
         main_layout.addWidget(self.show_graphs_button)
 
+        self.sessions_button = QPushButton("Recorded Sessions")
+        self.sessions_button.clicked.connect(self.show_sessions)
+        self.sessions_button.setProperty("role", "action")
+        self.sessions_button.setProperty("tone", "slate")
+        main_layout.addWidget(self.sessions_button)
+
+        self.spectrum_button = QPushButton("Vibration Spectrum")
+        self.spectrum_button.clicked.connect(self.show_spectrum)
+        self.spectrum_button.setProperty("role", "action")
+        self.spectrum_button.setProperty("tone", "gold")
+        main_layout.addWidget(self.spectrum_button)
+
         # Lap time table
         self.lap_table = QTableWidget()
         self.lap_table.setColumnCount(4)
@@ -612,76 +1025,120 @@ class TelemetryApp(QMainWindow):
             self.triangle_overlay.setGeometry(self.rect())
             self.refresh_triangles()
 
+    def set_timer_color(self, colors):
+        palette = self.timer_label.palette()
+        palette.setColor(QPalette.ColorRole.WindowText, QColor(colors["timer"]))
+        self.timer_label.setPalette(palette)
+
     def toggle_theme(self):
         self.dark_mode = not self.dark_mode
         if self.dark_mode:
             self.theme_button.setText("🌙")
-            ThemeManager.apply_dark_theme(QApplication.instance())
-            self.timer_label.setStyleSheet("font-size: 48px; font-weight: bold; color: #FFDD00;")
+            self.theme.apply_dark_theme(self)
         else:
             self.theme_button.setText("☀️")
-            ThemeManager.apply_light_theme(QApplication.instance())
-            self.timer_label.setStyleSheet("font-size: 48px; font-weight: bold; color: #FF8C00;")
-        self.update()
+            self.theme.apply_light_theme(self)
 
-    def process_serial_data(self, data):
-        try:
-            if "MT:" in data:
-                self.motor_temp = float(data.split("MT:")[1].strip())
-                self.motor_temp_display.setValue(self.motor_temp)
-            
-            elif "BT:" in data:
-                self.battery_temp = float(data.split("BT:")[1].strip())
-                self.battery_temp_display.setValue(self.battery_temp)
-                
-            elif "V:" in data:
-                self.vibration = float(data.split("V:")[1].strip())
-                self.vibration_label.setText(f"Vibration Level: {self.vibration:.1f}")
-            
-            elif "W" in data:
-                if not self.warning_active:
-                    self.warning_active = True
-                    self.warning_box.setStyleSheet("background-color: red; border: 3px solid red;")
-                    self.warning_timer.start(500)
-            
-        except Exception as e:
-            print(f"Error processing serial data: {e}")
+    def poll_ingest(self):
+        with POLL_SECONDS.time():
+            self.drain_ingest()
+
+    def drain_ingest(self):
+        # Everything here has already been recorded; only the newest value per channel is drawn
+        if self.ingest_process:
+            batch = self.recorder.poll()
+            t, channels, values = batch["t"], batch["channel"], batch["value"]
+            # The ring hands over every record, so this batch is complete
+            self.recent.extend(t, channels, values)
+            stats = self.recorder.stats()
+        else:
+            batch = self.serial_reader.queue.get_batch(self.recorder.now())
+            t, channels, values = (np.array(column) for column in zip(*batch)) if batch else (np.empty(0),) * 3
+            stats = self.serial_reader.queue.stats()
+        latest = dict(zip(channels.tolist(), values.tolist()))
+        for channel, value in latest.items():
+            if channel == ALERT_CHANNEL:
+                self.show_warning()
+            else:
+                self.show_value(CHANNELS[channel], value)
+        QUEUE_DEPTH.set(stats['depth'])
+        QUEUE_HIGH_WATER.set(stats['high_water'])
+        QUEUE_DROPPED.set(stats['dropped'])
+        QUEUE_LAG.set(stats['lag'])
+        status = (f"Queue {stats['depth']} (max {stats['high_water']}) | "
+                  f"Dropped {stats['dropped']} | Behind {stats['lag']:.2f} s")
+        if self.ingest_process and not self.recorder.running:
+            status = "Ingest process stopped - not recording | " + status
+        self.ingest_status_label.setText(status)
+
+    def show_value(self, channel, value):
+        if channel == "motor_temp":
+            self.motor_temp = value
+            self.motor_temp_display.setValue(self.motor_temp)
+        elif channel == "battery_temp":
+            self.battery_temp = value
+            self.battery_temp_display.setValue(self.battery_temp)
+        elif channel == "vibration":
+            self.vibration = value
+            self.vibration_label.setText(f"Vibration Level: {self.vibration:.1f}")
+        elif channel == PEAK_CHANNEL:
+            self.vibration_peak_label.setText(f"Dominant Vibration: {value:.0f} Hz")
+
+    def show_warning(self):
+        if not self.warning_active:
+            self.warning_active = True
+            restyle(self.warning_box, flash=True)
+            self.warning_timer.start(500)
+
+    def ensure_recording(self):
+        if self.recorder is None:
+            if self.ingest_process:
+                try:
+                    self.recorder = IngestProcess(spectrum_options=self.spectrum_options,
+                                                  spectrogram=self.spectrogram)
+                except RuntimeError as e:
+                    log.error("Could not start the ingest process, recording in the GUI process: %s", e)
+                    self.ingest_process = False
+            if not self.ingest_process:
+                self.recorder = SessionRecorder(self.catalog)
+            self.lap_analytics = LapAnalytics(self.catalog, self.recorder.session_id)
+            self.record_energy()
+        return self.recorder
+
+    def record_energy(self):
+        recorder = self.ensure_recording()
+        recorder.record_sample("energy", self.remaining_energy)
+        self.recent.append("energy", recorder.now(), self.remaining_energy)
 
     def connect_serial(self):
         port = self.port_combo.currentText()
         baud = int(self.baud_combo.currentText())
         
-        if self.serial_reader.connect_serial(port, baud):
+        if self.ingest_process:
+            # Starting the ingest process may fail, and recording falls back to this process
+            self.ensure_recording()
+        if self.ingest_process:
+            try:
+                connected = self.recorder.connect_serial(port, baud)
+            except RuntimeError as e:
+                log.error("Serial connection error: %s", e)
+                connected = False
+        else:
+            connected = self.serial_reader.connect_serial(port, baud)
+
+        if connected:
             self.connect_button.setText(f"Connected to {port}")
-            self.connect_button.setStyleSheet("background-color: #00A86B; font-weight: bold;")
-            self.serial_reader.start_reading()
-            self.data_timer.start(5000) 
+            restyle(self.connect_button, tone="green")
+            if not self.ingest_process:
+                self.serial_reader.start_reading(self.ensure_recording(), self.spectrum, self.recent)
+            self.ingest_timer.start(50)
         else:
             self.connect_button.setText("Connection Failed")
-            self.connect_button.setStyleSheet("background-color: #E74856; font-weight: bold;")
+            restyle(self.connect_button, tone="red")
 
     def toggle_warning(self):
         if self.warning_active:
-            current_style = self.warning_box.styleSheet()
-            if "background-color: red" in current_style:
-                self.warning_box.setStyleSheet("border: 2px solid red; background-color: transparent;")
-            else:
-                self.warning_box.setStyleSheet("background-color: red; border: 2px solid red;")
-
-    def collect_data_point(self):
-        if self.timer.isActive():
-            self.elapsed_time += 5  
-            
-            self.timestamps.append(self.elapsed_time)
-            self.motor_temps.append(self.motor_temp)
-            self.battery_temps.append(self.battery_temp)
-            self.energy_data.append(self.remaining_energy)
-            
-            if len(self.timestamps) > 120:
-                self.timestamps = self.timestamps[-120:]
-                self.motor_temps = self.motor_temps[-120:]
-                self.battery_temps = self.battery_temps[-120:]
-                self.energy_data = self.energy_data[-120:]
+            restyle(self.warning_box, flash=not self.warning_box.property("flash"))
 
     def format_time(self, seconds):
         minutes = seconds // 60
@@ -690,8 +1147,8 @@ class TelemetryApp(QMainWindow):
 
     def start_timer(self):
         if not self.timer.isActive():
+            self.ensure_recording()
             self.timer.start(1000)
-            self.data_timer.start(5000)
 
     def pause_timer(self):
         if self.timer.isActive():
@@ -714,6 +1171,11 @@ class TelemetryApp(QMainWindow):
             self.last_lap_time = self.heat_time_seconds
             self.lap_count_label.setText(f"Lap Count: {self.lap_count}")
 
+            self.record_energy()
+            self.recorder.record_lap(self.lap_count, time_taken, energy_used)
+            # Profiles just this lap; with a separate ingest process it may land on a later update
+            self.lap_analytics.update()
+
             row_position = self.lap_table.rowCount()
             self.lap_table.insertRow(row_position)
             self.lap_table.setItem(row_position, 0, QTableWidgetItem(str(self.lap_count)))
@@ -721,15 +1183,7 @@ class TelemetryApp(QMainWindow):
             self.lap_table.setItem(row_position, 2, QTableWidgetItem(f"{energy_used:.2f} Ah"))
 
             delete_button = QPushButton("Delete")
-            delete_button.setStyleSheet("""
-                QPushButton {
-                    background-color: #E74856;
-                    color: white;
-                    font-weight: bold;
-                    padding: 5px;
-                    min-width: 60px;
-                }
-            """)
+            delete_button.setProperty("role", "delete")
             delete_button.clicked.connect(lambda: self.lap_table.removeRow(row_position))
             self.lap_table.setCellWidget(row_position, 3, delete_button)
             
@@ -737,13 +1191,14 @@ class TelemetryApp(QMainWindow):
             self.energy_input.clear()
             
         except ValueError:
-            print("Invalid energy value entered")
+            log.warning("Invalid energy value entered")
 
     def pit_stop(self):
         if not hasattr(self, "in_pit_stop") or not self.in_pit_stop:
             # Entering pit stop
             self.in_pit_stop = True
             self.pit_start_time = self.heat_time_seconds
+            self.ensure_recording().begin_pit_stop()
 
             row_position = self.lap_table.rowCount()
             self.lap_table.insertRow(row_position)
@@ -751,11 +1206,14 @@ class TelemetryApp(QMainWindow):
             self.lap_table.setItem(row_position, 1, QTableWidgetItem("Entered Pit Stop"))
             self.lap_table.setItem(row_position, 2, QTableWidgetItem("--"))
             self.pit_stop_button.setText("Exit Pit Stop")
-            self.pit_stop_button.setStyleSheet("background-color: #00A86B; font-weight: bold;")
+            restyle(self.pit_stop_button, tone="green")
         else:
             # Exiting pit stop
             self.in_pit_stop = False
             pit_time = self.pit_start_time - self.heat_time_seconds
+            self.ensure_recording().end_pit_stop(pit_time)
+            # Re-profiles a lap that finished while this stop was still open
+            self.lap_analytics.update()
 
             row_position = self.lap_table.rowCount()
             self.lap_table.insertRow(row_position)
@@ -763,21 +1221,80 @@ class TelemetryApp(QMainWindow):
             self.lap_table.setItem(row_position, 1, QTableWidgetItem(f"Pit Stop Complete ({self.format_time(pit_time)})"))
             self.lap_table.setItem(row_position, 2, QTableWidgetItem("--"))
             self.pit_stop_button.setText("Pit Stop")
-            self.pit_stop_button.setStyleSheet("background-color: #E74856; font-weight: bold;")
+            restyle(self.pit_stop_button, tone="red")
 
     def show_graphs(self):
-        graph_window = GraphWindow(self)
+        if self.recorder is None:
+            history = SeriesHistory({channel: (np.empty(0), np.empty(0)) for channel in PLOT_CHANNELS})
+        else:
+            path = self.catalog.session(self.recorder.session_id)["path"]
+            history = SessionHistory(path, self.recent)
+        graph_window = GraphWindow(self, history, live=self.recorder is not None, analytics=self.lap_analytics)
         graph_window.exec()
+
+    def show_spectrum(self):
+        spectrum_window = SpectrogramWindow(self, self.spectrogram)
+        spectrum_window.exec()
+
+    def show_sessions(self):
+        if self.recorder is not None:
+            try:
+                self.recorder.flush()
+            except RuntimeError as e:
+                log.error("Could not flush the session before listing it: %s", e)
+        picker = SessionPickerDialog(self, self.catalog)
+        picker.exec()
         
     def closeEvent(self, event):
         self.serial_reader.stop_reading()
         self.timer.stop()
         self.warning_timer.stop()
-        self.data_timer.stop()
+        self.ingest_timer.stop()
+        if self.recorder is not None:
+            self.recorder.close()
+        self.catalog.close()
         event.accept()
 
+def parse_band_limits(text):
+    limits = [float(field) if field.strip() else None for field in text.split(",")]
+    if len(limits) != len(BANDS):
+        raise argparse.ArgumentTypeError(f"expected {len(BANDS)} comma separated limits")
+    return limits
+
 if __name__ == "__main__":
-    app = QApplication(sys.argv)
-    window = TelemetryApp()
+    # A frozen executable re-runs this script for the ingest process on Windows
+    multiprocessing.freeze_support()
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+    parser = argparse.ArgumentParser(description="VTS telemetry dashboard")
+    parser.add_argument("--ingest-process", action="store_true",
+                        help="read, parse and record serial data in a separate process")
+    parser.add_argument("--ingest-policy", choices=POLICIES, default="latest",
+                        help="what the display sees when it falls behind the serial thread; everything "
+                             "read is recorded, but block stalls serial reading while the GUI is busy, "
+                             "so the port can overflow and drop input")
+    parser.add_argument("--ingest-queue-size", type=int, default=QUEUE_SIZE,
+                        help="bound on records waiting for the display")
+    parser.add_argument("--vibration-rate", type=float, default=VIBRATION_RATE_HZ,
+                        help="sample rate of the vibration channel in Hz")
+    parser.add_argument("--vibration-band-limits", type=parse_band_limits, default=None,
+                        help="comma separated energy limits per vibration band "
+                             f"({', '.join(f'{lo}-{hi} Hz' for lo, hi in BANDS)}); leave a field empty to disable it")
+    parser.add_argument("--metrics-port", type=int, default=None,
+                        help="serve Prometheus metrics over HTTP on this port (localhost only)")
+    parser.add_argument("--metrics-file", default=None,
+                        help="write Prometheus metrics to this file every few seconds "
+                             "(for node_exporter's textfile collector)")
+    args, qt_args = parser.parse_known_args()
+    app = QApplication(sys.argv[:1] + qt_args)
+    if args.metrics_port is not None:
+        REGISTRY.serve(args.metrics_port)
+        log.info("Serving metrics on http://127.0.0.1:%d/metrics", args.metrics_port)
+    if args.metrics_file:
+        metrics_timer = QTimer()
+        metrics_timer.timeout.connect(lambda: REGISTRY.write_textfile(args.metrics_file))
+        metrics_timer.start(5000)
+    window = TelemetryApp(ingest_process=args.ingest_process, ingest_policy=args.ingest_policy,
+                          ingest_queue_size=args.ingest_queue_size, vibration_rate=args.vibration_rate,
+                          vibration_band_limits=args.vibration_band_limits)
     window.show()
     sys.exit(app.exec())
\ No newline at end of file
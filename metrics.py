@@ -0,0 +1,227 @@
+import bisect
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+LATENCY_BUCKETS = (0.00001, 0.00005, 0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0)
+
+# Instruments are plain attribute updates with no locking: they sit in the per-line hot
+# path, and an occasional lost increment between threads is an acceptable price.
+
+
+class Counter:
+    kind = "counter"
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.value = 0
+
+    def inc(self, amount=1):
+        self.value += amount
+
+    def touched(self):
+        return self.value != 0
+
+    def samples(self):
+        return [("", (), self.value)]
+
+
+class Gauge:
+    kind = "gauge"
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.value = 0
+        self._set = False
+
+    def set(self, value):
+        self.value = value
+        self._set = True
+
+    def touched(self):
+        return self._set
+
+    def samples(self):
+        return [("", (), self.value)]
+
+
+class Histogram:
+    kind = "histogram"
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.reset()
+
+    def reset(self):
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def time(self):
+        return _Timer(self)
+
+    def touched(self):
+        return self.count != 0
+
+    def samples(self):
+        samples = []
+        cumulative = 0
+        for upper, count in zip(self.buckets + (float("inf"),), self.counts):
+            cumulative += count
+            samples.append(("_bucket", (("le", _format_bound(upper)),), cumulative))
+        samples.append(("_sum", (), self.sum))
+        samples.append(("_count", (), self.count))
+        return samples
+
+
+class _Timer:
+    __slots__ = ("histogram", "start")
+
+    def __init__(self, histogram):
+        self.histogram = histogram
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.histogram.observe(time.perf_counter() - self.start)
+
+
+def bucket_quantile(buckets, q):
+    # buckets: [(upper bound, cumulative count)] as exported; interpolates inside the bucket
+    total = buckets[-1][1] if buckets else 0
+    if not total:
+        return 0.0
+    target = q * total
+    lower, seen = 0.0, 0
+    for upper, cumulative in buckets:
+        if cumulative >= target:
+            if upper == float("inf"):
+                return lower
+            return lower + (upper - lower) * (target - seen) / max(cumulative - seen, 1)
+        lower, seen = upper, cumulative
+    return lower
+
+
+def _format_bound(bound):
+    return "+Inf" if bound == float("inf") else repr(bound)
+
+
+def _format_labels(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{key}="{value}"' for key, value in labels) + "}"
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._metrics = {}
+        self._help = {}
+        self._lock = threading.Lock()
+        self._remote = []
+
+    def _get(self, cls, name, help, labels, **kwargs):
+        key = (name, tuple(sorted((labels or {}).items())))
+        metric = self._metrics.get(key)
+        if metric is None:
+            with self._lock:
+                metric = self._metrics.get(key)
+                if metric is None:
+                    metric = self._metrics[key] = cls(**kwargs)
+                    self._help[name] = help
+        return metric
+
+    def counter(self, name, help="", labels=None):
+        return self._get(Counter, name, help, labels)
+
+    def gauge(self, name, help="", labels=None):
+        return self._get(Gauge, name, help, labels)
+
+    def histogram(self, name, help="", labels=None, buckets=LATENCY_BUCKETS):
+        return self._get(Histogram, name, help, labels, buckets=buckets)
+
+    def reset(self):
+        # A forked child starts from the parent's values; it clears them before counting its own
+        for metric in list(self._metrics.values()):
+            metric.reset()
+
+    def add_remote(self, collect):
+        # collect() returns families from another process's registry (see collect below)
+        self._remote.append(collect)
+
+    def collect(self, extra_labels=(), touched_only=False):
+        families = {}
+        for (name, labels), metric in list(self._metrics.items()):
+            if touched_only and not metric.touched():
+                continue
+            family = families.setdefault(name, (metric.kind, self._help.get(name, ""), []))
+            for suffix, sample_labels, value in metric.samples():
+                family[2].append((suffix, labels + tuple(extra_labels) + sample_labels, value))
+        return families
+
+    def merged(self):
+        if not self._remote:
+            return self.collect()
+        # Every process imports every instrument, but only updates its own. With another
+        # process reporting, each side labels its series with process= and leaves out the
+        # ones it never updated, so neither exports frozen or zero copies of the other's.
+        families = self.collect((("process", "gui"),), touched_only=True)
+        for collect in self._remote:
+            for name, (kind, help, samples) in (collect() or {}).items():
+                families.setdefault(name, (kind, help, []))[2].extend(samples)
+        return families
+
+    def render(self):
+        families = self.merged()
+        lines = []
+        for name in sorted(families):
+            kind, help, samples = families[name]
+            if help:
+                lines.append(f"# HELP {name} {help}")
+            lines.append(f"# TYPE {name} {kind}")
+            for suffix, labels, value in samples:
+                lines.append(f"{name}{suffix}{_format_labels(labels)} {value}")
+        return "\n".join(lines) + "\n"
+
+    def write_textfile(self, path):
+        # Atomic replace so a scraper never reads a half-written file
+        tmp = f"{path}.tmp"
+        with open(tmp, "w") as f:
+            f.write(self.render())
+        os.replace(tmp, path)
+
+    def serve(self, port, host="127.0.0.1"):
+        registry = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path not in ("/", "/metrics"):
+                    self.send_error(404)
+                    return
+                body = registry.render().encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        server = ThreadingHTTPServer((host, port), Handler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        return server
+
+
+REGISTRY = MetricsRegistry()
@@ -0,0 +1,38 @@
+import numpy as np
+
+
+class MirroredRing:
+    # Fixed-size ring over one or more parallel float64 columns. Each item is written twice,
+    # at pos and pos + capacity, so the newest items in order are always one contiguous slice
+    # and reading them needs no wrap-around copy.
+    def __init__(self, capacity, columns=1):
+        self.capacity = capacity
+        self.columns = [np.zeros(2 * capacity) for _ in range(columns)]
+        self.pos = 0
+        self.filled = 0
+
+    def append(self, *row):
+        # One value per column; plain scalar stores, for per-sample callers
+        pos = self.pos
+        for column, value in zip(self.columns, row):
+            column[pos] = value
+            column[pos + self.capacity] = value
+        self.pos = pos + 1 if pos + 1 < self.capacity else 0
+        if self.filled < self.capacity:
+            self.filled += 1
+
+    def extend(self, *rows):
+        # One array per column; only the newest capacity items can survive
+        count = min(len(rows[0]), self.capacity)
+        index = (self.pos + np.arange(count)) % self.capacity
+        for column, new in zip(self.columns, rows):
+            new = np.asarray(new, dtype=np.float64)[len(new) - count:]
+            column[index] = new
+            column[index + self.capacity] = new
+        self.pos = (self.pos + count) % self.capacity
+        self.filled = min(self.filled + count, self.capacity)
+
+    def latest(self):
+        # Views of every column over the items held, oldest first
+        start = self.pos + self.capacity - self.filled
+        return [column[start:self.pos + self.capacity] for column in self.columns]
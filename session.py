@@ -0,0 +1,96 @@
+import os
+import threading
+import time
+
+from catalog import SessionCatalog
+from codec import SessionReader, SessionWriter
+from spectrum import DERIVED_CHANNELS
+
+SESSION_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "sessions")
+CATALOG_PATH = os.path.join(SESSION_DIR, "catalog.db")
+
+CHANNELS = ("motor_temp", "battery_temp", "vibration", "energy") + DERIVED_CHANNELS
+CHANNEL_IDS = {name: i for i, name in enumerate(CHANNELS)}
+
+def open_catalog(directory=SESSION_DIR):
+    os.makedirs(directory, exist_ok=True)
+    return SessionCatalog(os.path.join(directory, "catalog.db"))
+
+
+def load_range(catalog, session_id, t0=None, t1=None, channels=CHANNELS):
+    session = catalog.session(session_id)
+    if session is None:
+        raise KeyError(f"Unknown session {session_id}")
+    reader = SessionReader(session["path"])
+    return {channel: reader.read(CHANNEL_IDS[channel], t0, t1) for channel in channels}
+
+
+def load_lap(catalog, session_id, lap, channels=CHANNELS):
+    row = catalog.lap(session_id, lap)
+    if row is None:
+        raise KeyError(f"Session {session_id} has no lap {lap}")
+    return load_range(catalog, session_id, row["start_t"], row["end_t"], channels)
+
+
+class SessionRecorder:
+    def __init__(self, catalog, directory=SESSION_DIR):
+        os.makedirs(directory, exist_ok=True)
+        self.catalog = catalog
+        self.started_at = time.time()
+        self.path = os.path.join(directory, time.strftime("session-%Y%m%d-%H%M%S.vts",
+                                                          time.localtime(self.started_at)))
+        self.session_id = catalog.begin_session(self.started_at, self.path)
+        self._clock = time.monotonic()
+        self._writer = SessionWriter(self.path)
+        # Samples arrive on the serial thread while laps are recorded from the GUI
+        self._lock = threading.Lock()
+        self._lap_stats = {}
+        self.lap_start_t = 0.0
+        self.pit_start_t = None
+
+    def now(self):
+        return time.monotonic() - self._clock
+
+    def record_sample(self, channel, value, t=None):
+        t = self.now() if t is None else t
+        with self._lock:
+            self._writer.append(CHANNEL_IDS[channel], t, value)
+            stats = self._lap_stats.get(channel)
+            if stats is None:
+                self._lap_stats[channel] = [value, value, value, 1]
+            else:
+                stats[0] = min(stats[0], value)
+                stats[1] = max(stats[1], value)
+                stats[2] += value
+                stats[3] += 1
+
+    def record_lap(self, lap, duration, energy_used):
+        with self._lock:
+            end_t = self.now()
+            stats = {channel: (lo, hi, total / count, count)
+                     for channel, (lo, hi, total, count) in self._lap_stats.items()}
+            self._writer.flush()
+            self._lap_stats = {}
+            start_t, self.lap_start_t = self.lap_start_t, end_t
+        self.catalog.add_lap(self.session_id, lap, start_t, end_t, duration, energy_used, stats)
+
+    def begin_pit_stop(self):
+        self.pit_start_t = self.now()
+
+    def end_pit_stop(self, duration):
+        if self.pit_start_t is None:
+            return
+        self.catalog.add_pit_stop(self.session_id, self.pit_start_t, self.now(), duration)
+        self.pit_start_t = None
+
+    def record_alert(self, kind, channel=None, value=None):
+        self.catalog.add_alert(self.session_id, self.now(), kind, channel, value)
+
+    def flush(self):
+        with self._lock:
+            self._writer.flush()
+
+    def close(self):
+        with self._lock:
+            self._writer.close()
+        self.catalog.end_session(self.session_id, time.time())
@@ -0,0 +1,126 @@
+import threading
+import numpy as np
+
+from ringbuffer import MirroredRing
+
+VIBRATION_RATE_HZ = 1000
+WINDOW_SIZE = 1024
+OVERLAP = 0.5
+HISTORY = 256
+BANDS = ((0, 50), (50, 150), (150, 300), (300, 500))
+BAND_CHANNELS = tuple(f"vib_band_{lo}_{hi}" for lo, hi in BANDS)
+PEAK_CHANNEL = "vib_peak_hz"
+DERIVED_CHANNELS = BAND_CHANNELS + (PEAK_CHANNEL,)
+
+
+class SpectrumAnalyzer:
+    # Windowed, overlapped FFT over the vibration stream. Every buffer is allocated up
+    # front and the per-window work writes into them with out=, so a kHz stream does
+    # not churn the allocator. Each window is published to display (a Spectrogram, or
+    # anything with the same add()), since the analyzer runs off the GUI thread.
+    def __init__(self, sample_rate=VIBRATION_RATE_HZ, window_size=WINDOW_SIZE, overlap=OVERLAP,
+                 band_limits=None, display=None):
+        self.sample_rate = sample_rate
+        self.size = window_size
+        self.hop = max(1, int(window_size * (1 - overlap)))
+        self.window = np.hanning(window_size)
+        # Normalise so a sine of amplitude A adds A**2 / 2 to the energy of its band
+        self.scale = 2.0 / (window_size * np.sum(self.window ** 2))
+        self.freqs = np.fft.rfftfreq(window_size, 1.0 / sample_rate)
+
+        self.ring = MirroredRing(window_size)
+        self.pending = 0
+
+        self.frame = np.empty(window_size)
+        self.spectrum = np.empty(len(self.freqs), dtype=np.complex128)
+        self.power = np.empty(len(self.freqs))
+        self.power_db = np.empty(len(self.freqs))
+
+        edges = [lo for lo, hi in BANDS] + [BANDS[-1][1]]
+        self.band_stop = min(np.searchsorted(self.freqs, edges[-1], side="right"), len(self.freqs))
+        starts = np.searchsorted(self.freqs, edges[:-1])
+        # Bands above Nyquist at a low sample rate are reported as zero energy
+        self.band_valid = (starts < self.band_stop).astype(np.float64)
+        self.band_starts = np.minimum(starts, self.band_stop - 1)
+        self.band_energy = np.zeros(len(BANDS))
+        self.band_limits = band_limits or [None] * len(BANDS)
+        self.band_over = [False] * len(BANDS)
+        self.peak_hz = 0.0
+
+        self.display = display
+        self.windows = 0
+
+    def push_sample(self, value):
+        self.ring.append(value)
+        self.pending += 1
+        if self.pending >= self.hop and self.ring.filled == self.size:
+            self.pending = 0
+            return self._analyze()
+        return None
+
+    def push(self, values):
+        results = []
+        for value in np.asarray(values, dtype=np.float64):
+            result = self.push_sample(value)
+            if result is not None:
+                results.append(result)
+        return results
+
+    def _analyze(self):
+        latest = self.ring.latest()[0]
+        # Remove the sensor offset first: the window would smear it into the lowest bins
+        np.subtract(latest, latest.mean(), out=self.frame)
+        np.multiply(self.frame, self.window, out=self.frame)
+        np.fft.rfft(self.frame, out=self.spectrum)
+        np.abs(self.spectrum, out=self.power)
+        np.square(self.power, out=self.power)
+        np.multiply(self.power, self.scale, out=self.power)
+        np.add.reduceat(self.power[:self.band_stop], self.band_starts, out=self.band_energy)
+        np.multiply(self.band_energy, self.band_valid, out=self.band_energy)
+        # Skip the DC bin, whatever is left of the offset after mean removal
+        self.peak_hz = float(self.freqs[1 + np.argmax(self.power[1:])])
+
+        np.add(self.power, 1e-12, out=self.power_db)
+        np.log10(self.power_db, out=self.power_db)
+        np.multiply(self.power_db, 10.0, out=self.power_db)
+        self.windows += 1
+        if self.display is not None:
+            self.display.add(self.power_db, self.band_energy, self.peak_hz)
+
+        # Band alerts fire once when a band crosses its limit, not on every window above it
+        alerts = []
+        for i, limit in enumerate(self.band_limits):
+            over = limit is not None and self.band_energy[i] > limit
+            if over and not self.band_over[i]:
+                alerts.append((BAND_CHANNELS[i], float(self.band_energy[i])))
+            self.band_over[i] = over
+        return alerts
+
+    def derived(self):
+        return list(zip(BAND_CHANNELS, self.band_energy.tolist())) + [(PEAK_CHANNEL, self.peak_hz)]
+
+
+class Spectrogram:
+    # What the waterfall view shows: the newest spectra, plus the band energies and peak of
+    # the last window. Written by the analyzer's thread and read by the GUI timer, so a
+    # window's row, bands and peak are swapped in together under the lock.
+    def __init__(self, sample_rate=VIBRATION_RATE_HZ, window_size=WINDOW_SIZE, history=HISTORY):
+        self.freqs = np.fft.rfftfreq(window_size, 1.0 / sample_rate)
+        self.history = history
+        self.waterfall = np.full((history, len(self.freqs)), -120.0)
+        self.band_energy = np.zeros(len(BANDS))
+        self.peak_hz = 0.0
+        self.row = 0
+        self._lock = threading.Lock()
+
+    def add(self, power_db, band_energy, peak_hz):
+        with self._lock:
+            self.waterfall[self.row] = power_db
+            self.band_energy[:] = band_energy
+            self.peak_hz = peak_hz
+            self.row = (self.row + 1) % self.history
+
+    def snapshot(self):
+        # Copies, oldest row first, so the caller draws without holding the lock
+        with self._lock:
+            return np.roll(self.waterfall, -self.row, axis=0), self.band_energy.copy(), self.peak_hz
@@ -1,95 +1,267 @@
+from PyQt6.QtCore import QObject, Qt, pyqtSignal
 from PyQt6.QtGui import QColor, QPalette
-from PyQt6.QtWidgets import QWidget
-
-class ThemeManager:
-    @staticmethod
-    def apply_dark_theme(app):
-        palette = app.palette()
-        palette.setColor(QPalette.ColorRole.Window, QColor(30, 30, 30))
-        palette.setColor(QPalette.ColorRole.WindowText, QColor(224, 224, 224))
-        palette.setColor(QPalette.ColorRole.Base, QColor(45, 45, 48))
-        palette.setColor(QPalette.ColorRole.AlternateBase, QColor(53, 53, 53))
-        palette.setColor(QPalette.ColorRole.ToolTipBase, QColor(53, 53, 53))
-        palette.setColor(QPalette.ColorRole.ToolTipText, QColor(224, 224, 224))
-        palette.setColor(QPalette.ColorRole.Text, QColor(224, 224, 224))
-        palette.setColor(QPalette.ColorRole.Button, QColor(45, 45, 48))
-        palette.setColor(QPalette.ColorRole.ButtonText, QColor(224, 224, 224))
-        palette.setColor(QPalette.ColorRole.BrightText, QColor(255, 0, 0))
-        palette.setColor(QPalette.ColorRole.Highlight, QColor(0, 120, 215))
-        palette.setColor(QPalette.ColorRole.HighlightedText, QColor(255, 255, 255))
-        app.setPalette(palette)
-
-        # Additional widget-specific styling
-        app.setStyleSheet("""
-            QFrame {
-                border: 1px solid #3F3F46;
-                border-radius: 4px;
-                padding: 5px;
-            }
-            QPushButton {
-                min-width: 80px;
-                padding: 6px;
-                font-weight: bold;
-            }
-            QTableWidget {
-                gridline-color: #3F3F46;
-            }
-            QHeaderView::section {
-                background-color: #333337;
-                padding: 5px;
-                border: 1px solid #3F3F46;
-            }
-            QProgressBar {
-                border: 1px solid #3F3F46;
-                text-align: center;
-            }
-            QProgressBar::chunk {
-                background-color: #0078D7;
-            }
-        """)
-
-    @staticmethod
-    def apply_light_theme(app):
-        palette = app.palette()
-        palette.setColor(QPalette.ColorRole.Window, QColor(240, 240, 240))
-        palette.setColor(QPalette.ColorRole.WindowText, QColor(0, 0, 0))
-        palette.setColor(QPalette.ColorRole.Base, QColor(255, 255, 255))
-        palette.setColor(QPalette.ColorRole.AlternateBase, QColor(240, 240, 240))
-        palette.setColor(QPalette.ColorRole.ToolTipBase, QColor(255, 255, 220))
-        palette.setColor(QPalette.ColorRole.ToolTipText, QColor(0, 0, 0))
-        palette.setColor(QPalette.ColorRole.Text, QColor(0, 0, 0))
-        palette.setColor(QPalette.ColorRole.Button, QColor(240, 240, 240))
-        palette.setColor(QPalette.ColorRole.ButtonText, QColor(0, 0, 0))
-        palette.setColor(QPalette.ColorRole.BrightText, QColor(255, 0, 0))
-        palette.setColor(QPalette.ColorRole.Highlight, QColor(0, 120, 215))
-        palette.setColor(QPalette.ColorRole.HighlightedText, QColor(255, 255, 255))
-        app.setPalette(palette)
-
-        # Additional widget-specific styling
-        app.setStyleSheet("""
-            QFrame {
-                border: 1px solid #CCCCCC;
-                border-radius: 4px;
-                padding: 5px;
-            }
-            QPushButton {
-                min-width: 80px;
-                padding: 6px;
-                font-weight: bold;
-            }
-            QTableWidget {
-                gridline-color: #CCCCCC;
-            }
-            QHeaderView::section {
-                background-color: #F0F0F0;
-                padding: 5px;
-                border: 1px solid #CCCCCC;
-            }
-            QProgressBar {
-                border: 1px solid #CCCCCC;
-                text-align: center;
-            }
-            QProgressBar::chunk {
-                background-color: #0078D7;
-            }
-        """)
\ No newline at end of file
+from PyQt6.QtWidgets import QComboBox, QHeaderView, QLineEdit
+
+THEMES = {
+    "dark": {
+        "window": "#1E1E1E",
+        "text": "#E0E0E0",
+        "input": "#333337",
+        "border": "#3F3F46",
+        "table": "#252526",
+        "header": "#333337",
+        "timer": "#FFDD00",
+        "bar_background": "#3C3C3C",
+        "bar_border": "#646464",
+        "plot_background": "#2D2D30",
+        "plot_text": "#E0E0E0",
+        "plot_grid": "#3F3F46",
+        "palette": {
+            QPalette.ColorRole.AlternateBase: (53, 53, 53),
+            QPalette.ColorRole.ToolTipBase: (53, 53, 53),
+            QPalette.ColorRole.ToolTipText: (224, 224, 224),
+            QPalette.ColorRole.ButtonText: (224, 224, 224),
+            QPalette.ColorRole.BrightText: (255, 0, 0),
+            QPalette.ColorRole.Highlight: (0, 120, 215),
+            QPalette.ColorRole.HighlightedText: (255, 255, 255),
+        },
+    },
+    "light": {
+        "window": "#F5F5F5",
+        "text": "#333333",
+        "input": "#FFFFFF",
+        "border": "#CCCCCC",
+        "table": "#FFFFFF",
+        "header": "#F0F0F0",
+        "timer": "#FF8C00",
+        "bar_background": "#DCDCDC",
+        "bar_border": "#B4B4B4",
+        "plot_background": "#FFFFFF",
+        "plot_text": "#333333",
+        "plot_grid": "#CCCCCC",
+        "palette": {
+            QPalette.ColorRole.AlternateBase: (240, 240, 240),
+            QPalette.ColorRole.ToolTipBase: (255, 255, 220),
+            QPalette.ColorRole.ToolTipText: (0, 0, 0),
+            QPalette.ColorRole.ButtonText: (0, 0, 0),
+            QPalette.ColorRole.BrightText: (255, 0, 0),
+            QPalette.ColorRole.Highlight: (0, 120, 215),
+            QPalette.ColorRole.HighlightedText: (255, 255, 255),
+        },
+    },
+}
+
+# Palette roles filled from the theme colours above, for all widgets and per widget class
+PALETTE_COLORS = {
+    None: {
+        QPalette.ColorRole.Window: "window",
+        QPalette.ColorRole.WindowText: "text",
+        QPalette.ColorRole.Text: "text",
+        QPalette.ColorRole.Base: "input",
+        QPalette.ColorRole.Button: "header",
+    },
+    "QTableView": {QPalette.ColorRole.Base: "table"},
+}
+# Widgets whose stylesheet box fills its background from the palette; Qt keeps the brush it
+# resolved when the widget was polished, so these few are re-polished on a theme switch
+REPOLISH_CLASSES = (QLineEdit, QComboBox, QHeaderView)
+
+# Widgets pick up their look from a "role" property instead of carrying their own
+# stylesheet, and the stylesheet itself holds no theme colours: it is set once, and a theme
+# switch only hands Qt a new palette. Re-setting a stylesheet re-polishes every widget,
+# which with hundreds of lap table buttons stalls the window for a visible moment.
+# Borders are a translucent grey that reads as a soft line on both backgrounds.
+STYLESHEET = """
+    QLabel {
+        font-size: 14px;
+    }
+    QLabel[role="title"] {
+        font-size: 28px;
+        font-weight: bold;
+    }
+    QLabel[role="timer"] {
+        font-size: 48px;
+        font-weight: bold;
+    }
+    QLabel[role="heading"] {
+        font-size: 16px;
+        font-weight: bold;
+    }
+    QLabel[role="reading"] {
+        font-size: 18px;
+    }
+    QLabel[role="metric"] {
+        font-size: 18px;
+        font-weight: bold;
+    }
+    QLabel[role="field"] {
+        font-weight: bold;
+    }
+    QLabel[role="hud"] {
+        background-color: rgba(0, 0, 0, 180);
+        color: #7CFC00;
+        font-family: monospace;
+        font-size: 11px;
+        padding: 6px;
+        border-radius: 4px;
+    }
+    QPushButton {
+        background-color: #0078D7;
+        color: white;
+        border: none;
+        padding: 8px;
+        min-width: 100px;
+        font-weight: bold;
+        font-size: 14px;
+    }
+    QPushButton[role="action"] {
+        min-width: 120px;
+    }
+    QPushButton[role="action"][tone="green"] {
+        background-color: #00A86B;
+    }
+    QPushButton[role="action"][tone="orange"] {
+        background-color: #FF8C00;
+    }
+    QPushButton[role="action"][tone="red"] {
+        background-color: #E74856;
+    }
+    QPushButton[role="action"][tone="purple"] {
+        background-color: #8A2BE2;
+    }
+    QPushButton[role="action"][tone="slate"] {
+        background-color: #5C5C8A;
+    }
+    QPushButton[role="action"][tone="gold"] {
+        background-color: #B8860B;
+    }
+    QPushButton[role="delete"] {
+        background-color: #E74856;
+        padding: 5px;
+        min-width: 60px;
+    }
+    QPushButton[role="theme-toggle"] {
+        border: none;
+        background: transparent;
+        font-size: 30px;
+        padding: 0px;
+    }
+    QLineEdit {
+        border: 1px solid rgba(128, 128, 128, 110);
+        padding: 6px;
+        min-height: 30px;
+        font-size: 14px;
+    }
+    QLineEdit[role="entry"] {
+        font-size: 16px;
+    }
+    QComboBox {
+        border: 1px solid rgba(128, 128, 128, 110);
+        padding: 6px;
+        min-height: 30px;
+        font-size: 14px;
+        border-radius: 4px;
+    }
+    QComboBox QAbstractItemView {
+        selection-background-color: #0078D7;
+        border: 1px solid rgba(128, 128, 128, 110);
+    }
+    QComboBox::drop-down {
+        border: none;
+    }
+    QTableWidget {
+        gridline-color: rgba(128, 128, 128, 110);
+        font-size: 14px;
+    }
+    QHeaderView::section {
+        padding: 8px;
+        border: 1px solid rgba(128, 128, 128, 110);
+        font-size: 14px;
+    }
+    QFrame {
+        border: 1px solid rgba(128, 128, 128, 110);
+        border-radius: 5px;
+    }
+    QFrame[role="warning"] {
+        border: 3px solid red;
+        background: transparent;
+    }
+    QFrame[role="warning"][flash="true"] {
+        background-color: red;
+    }
+"""
+
+
+def restyle(widget, **properties):
+    # Re-polish a single widget after changing one of the properties the stylesheet keys on
+    for name, value in properties.items():
+        widget.setProperty(name, value)
+    widget.style().unpolish(widget)
+    widget.style().polish(widget)
+
+
+class ThemeManager(QObject):
+    theme_changed = pyqtSignal(dict)
+
+    _instance = None
+
+    def __init__(self, app):
+        super().__init__()
+        self.app = app
+        self.name = None
+        # Only widgets with colours in their rules get a palette from the stylesheet; the
+        # rest follow the application palette, so switching it needs no re-polish
+        app.setAttribute(Qt.ApplicationAttribute.AA_UseStyleSheetPropagationInWidgetStyles)
+        app.setStyleSheet(STYLESHEET)
+        # Palettes are built once; switching only hands the cached ones to Qt
+        self._palettes = {}
+        for name, theme in THEMES.items():
+            palette = app.palette()
+            for role, rgb in theme["palette"].items():
+                palette.setColor(role, QColor(*rgb))
+            palettes = {}
+            for class_name, roles in PALETTE_COLORS.items():
+                palettes[class_name] = QPalette(palettes.get(None, palette))
+                for role, color in roles.items():
+                    palettes[class_name].setColor(role, QColor(theme[color]))
+            self._palettes[name] = palettes
+        ThemeManager._instance = self
+
+    @classmethod
+    def instance(cls):
+        return cls._instance
+
+    @property
+    def colors(self):
+        return THEMES[self.name]
+
+    @property
+    def dark(self):
+        return self.name == "dark"
+
+    def follow(self, dialog, slot):
+        # A dialog follows theme switches while it is open; closing it drops the connection,
+        # so windows opened earlier in the session are not restyled on every switch
+        self.theme_changed.connect(slot)
+        dialog.finished.connect(lambda: self.theme_changed.disconnect(slot))
+
+    def apply(self, name, window=None):
+        if name == self.name:
+            return
+        self.name = name
+        if window is not None:
+            window.setUpdatesEnabled(False)
+        for class_name, palette in self._palettes[name].items():
+            self.app.setPalette(palette, class_name)
+        for widget in self.app.allWidgets():
+            if isinstance(widget, REPOLISH_CLASSES):
+                restyle(widget)
+        self.theme_changed.emit(THEMES[name])
+        if window is not None:
+            window.setUpdatesEnabled(True)
+
+    def apply_dark_theme(self, window=None):
+        self.apply("dark", window)
+
+    def apply_light_theme(self, window=None):
+        self.apply("light", window)